@@ -0,0 +1,210 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from .auth import token_subject
+from .metrics import registry
+
+# Requests handled at once across the process; 0 disables the cap. The
+# default matches Starlette's threadpool, which is what sync handlers queue on.
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "40"))
+# Requests allowed to wait for a slot; anything beyond is shed with a 503.
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+# Exports and imports hold their slot for as long as the client streams, so
+# they get a small cap of their own instead of pinning the global slots.
+ADMISSION_MAX_TRANSFERS = int(os.getenv("ADMISSION_MAX_TRANSFERS", "4"))
+# Per-user token buckets, requests per second with a burst allowance. A rate
+# of 0 turns that bucket off.
+RATE_LIMIT_READS_PER_SECOND = float(os.getenv("RATE_LIMIT_READS_PER_SECOND", "0"))
+RATE_LIMIT_READ_BURST = int(os.getenv("RATE_LIMIT_READ_BURST", "60"))
+RATE_LIMIT_WRITES_PER_SECOND = float(os.getenv("RATE_LIMIT_WRITES_PER_SECOND", "0"))
+RATE_LIMIT_WRITE_BURST = int(os.getenv("RATE_LIMIT_WRITE_BURST", "20"))
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "100000"))
+
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+# Long-lived or operational endpoints that must not hold or wait for a slot.
+EXEMPT_PATHS = frozenset(("/events", "/metrics"))
+# Subject to the global cap, but not to the per-user buckets.
+RATE_LIMIT_EXEMPT_PATHS = frozenset(("/token",))
+# Admitted against the transfer cap rather than the global one.
+TRANSFER_PATHS = frozenset(("/tasks/export", "/tasks/import"))
+
+rejected = registry.counter("admission_rejected_total", "Requests shed by admission control", ("reason",))
+
+
+# Counting semaphore with a bounded FIFO of waiters. All state is touched
+# from the event loop thread only, so there are no locks: acquire either
+# takes a free slot, joins the queue, or fails at once when the queue is full.
+class ConcurrencyLimiter:
+    def __init__(self, limit: int = ADMISSION_MAX_CONCURRENCY, max_queue: int = ADMISSION_MAX_QUEUE,
+                 timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> str | None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as we gave up
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return "timeout"
+        return None
+
+    def release(self):
+        # hand the slot straight to the oldest waiter; active stays the same
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+# One token bucket per user id, refilled lazily on each take. Buckets that
+# have refilled to the brim carry no information and are dropped when the map
+# outgrows max_users.
+class RateLimiter:
+    def __init__(self, rate: float, burst: int, max_users: int = RATE_LIMIT_MAX_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = {}
+
+    def take(self, key, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_users:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _prune(self, now: float):
+        full = [key for key, bucket in self._buckets.items()
+                if bucket.tokens + (now - bucket.updated) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_users:
+            self._buckets.clear()
+
+
+class AdmissionController:
+    def __init__(self):
+        self.concurrency = ConcurrencyLimiter() if ADMISSION_MAX_CONCURRENCY else None
+        self.transfers = ConcurrencyLimiter(ADMISSION_MAX_TRANSFERS, ADMISSION_MAX_TRANSFERS) if ADMISSION_MAX_TRANSFERS else None
+        self.reads = RateLimiter(RATE_LIMIT_READS_PER_SECOND, RATE_LIMIT_READ_BURST) if RATE_LIMIT_READS_PER_SECOND else None
+        self.writes = RateLimiter(RATE_LIMIT_WRITES_PER_SECOND, RATE_LIMIT_WRITE_BURST) if RATE_LIMIT_WRITES_PER_SECOND else None
+
+
+controller = AdmissionController()
+
+registry.callback("admission_in_flight", "Requests holding an admission slot",
+                  lambda: controller.concurrency.active if controller.concurrency else 0)
+registry.callback("admission_queued", "Requests waiting for an admission slot",
+                  lambda: controller.concurrency.queued if controller.concurrency else 0)
+registry.callback("admission_transfers_in_flight", "Exports and imports holding a transfer slot",
+                  lambda: controller.transfers.active if controller.transfers else 0)
+
+
+def _bearer_token(scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+    return None
+
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = b'{"detail":"' + detail.encode() + b'"}'
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# Pure ASGI middleware in front of the routes. Per-user buckets are checked
+# first so a throttled client never takes a slot, then the request waits for
+# a slot: the transfer cap for exports and imports, the global one otherwise.
+# Requests without a valid bearer token skip the buckets; the route rejects
+# them anyway.
+class AdmissionMiddleware:
+    def __init__(self, app, controller: AdmissionController = controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+        if scope["path"] not in RATE_LIMIT_EXEMPT_PATHS:
+            is_read = scope["method"] in READ_METHODS
+            limiter = self.controller.reads if is_read else self.controller.writes
+            if limiter is not None:
+                token = _bearer_token(scope)
+                subject = token_subject(token) if token else None
+                if subject is not None:
+                    wait = limiter.take(subject)
+                    if wait:
+                        rejected.inc("read_rate" if is_read else "write_rate")
+                        return await _reject(send, 429, "Rate limit exceeded", wait)
+
+        if scope["path"] in TRANSFER_PATHS:
+            concurrency = self.controller.transfers
+        else:
+            concurrency = self.controller.concurrency
+        if concurrency is None:
+            return await self.app(scope, receive, send)
+        reason = await concurrency.acquire()
+        if reason is not None:
+            rejected.inc(reason)
+            return await _reject(send, 503, "Server busy, try again shortly", 1)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency.release()
+
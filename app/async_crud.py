@@ -0,0 +1,140 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from . import models, schemas, projection
+from .events import bus
+from .reminders import local_time
+from .crud import TASK_INCLUDES, detach_category_statement, omit_excluded, task_counts, task_counts_statement, task_loader_options, tasks_statement
+
+# Async counterparts of the read/write paths in crud.py. Relationships that
+# the response schemas serialize are loaded eagerly, since AsyncSession
+# cannot lazy load on attribute access.
+
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.scalar(select(models.User).where(models.User.id == user_id))
+
+async def get_user_version(db: AsyncSession, user_id: int):
+    return await db.scalar(select(models.UserVersion.version).where(models.UserVersion.user_id == user_id)) or 0
+
+async def get_user_with_tasks(db: AsyncSession, user_id: int):
+    return await db.scalar(
+        select(models.User)
+        .where(models.User.id == user_id)
+        .options(selectinload(models.User.tasks).joinedload(models.Task.category))
+    )
+
+async def get_user_profile(db: AsyncSession, user, include_tasks: int = 0):
+    counts = task_counts(*(await db.execute(task_counts_statement(user.id))).one())
+    tasks = await get_tasks(db, user_id=user.id, limit=include_tasks) if include_tasks else None
+    return schemas.UserProfile(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        is_active=user.is_active,
+        task_counts=counts,
+        tasks=tasks
+    )
+
+async def get_tasks(db: AsyncSession, user_id: int, include=TASK_INCLUDES, **filters):
+    statement = tasks_statement(user_id, **filters).options(*task_loader_options(include))
+    return omit_excluded((await db.scalars(statement)).all(), include)
+
+async def get_task_rows(db: AsyncSession, user_id: int, fields, **filters):
+    statement = projection.select_fields(tasks_statement(user_id, **filters), fields, filters.get("order_by", "id"))
+    return (await db.execute(statement)).all()
+
+async def get_task(db: AsyncSession, task_id: int, user_id: int):
+    return await db.scalar(
+        select(models.Task)
+        .where(models.Task.id == task_id, models.Task.owner_id == user_id)
+        .options(*task_loader_options())
+        .execution_options(populate_existing=True)
+    )
+
+async def create_task(db: AsyncSession, task: schemas.TaskCreate, user_id: int):
+    db_task = models.Task(
+        title=task.title,
+        description=task.description,
+        completed=task.completed,
+        deadline=task.deadline,
+        owner_id=user_id,
+        category_id=task.category_id,
+        reminder_time=None,
+        reminder_sent=False
+    )
+    db.add(db_task)
+    await db.commit()
+    bus.publish(user_id, "task.created", task_ids=[db_task.id])
+    return await get_task(db, db_task.id, user_id)
+
+async def update_task(db: AsyncSession, task_id: int, task: schemas.TaskUpdate, user_id: int):
+    update_data = task.model_dump(exclude_unset=True)
+    if update_data:
+        result = await db.execute(
+            update(models.Task)
+            .where(models.Task.id == task_id, models.Task.owner_id == user_id)
+            .values(**update_data)
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            return None
+        await db.commit()
+        bus.publish(user_id, "task.updated", task_ids=[task_id])
+    return await get_task(db, task_id, user_id)
+
+async def set_reminder(db: AsyncSession, task_id: int, reminder: schemas.ReminderTime, user_id: int):
+    db_task = await get_task(db, task_id, user_id)
+    if db_task is None:
+        return None
+    db_task.reminder_time = local_time(reminder.reminder_time)
+    db_task.reminder_sent = False
+    db_task.reminder_lease_owner = None
+    db_task.reminder_lease_expires = None
+    await db.commit()
+    bus.publish(user_id, "task.updated", task_ids=[task_id])
+    return db_task
+
+async def delete_task(db: AsyncSession, task_id: int, user_id: int):
+    db_task = await get_task(db, task_id, user_id)
+    if not db_task:
+        return None
+    await db.delete(db_task)
+    await db.commit()
+    bus.publish(user_id, "task.deleted", task_ids=[task_id])
+    return db_task
+
+async def get_category_by_name(db: AsyncSession, user_id: int, name: str):
+    return await db.scalar(select(models.Category).where(
+        models.Category.owner_id == user_id,
+        models.Category.name == name
+    ))
+
+async def get_category(db: AsyncSession, user_id: int, category_id: int):
+    return await db.scalar(select(models.Category).where(
+        models.Category.owner_id == user_id,
+        models.Category.id == category_id
+    ))
+
+async def get_categories(db: AsyncSession, user_id: int):
+    return (await db.scalars(select(models.Category).where(
+        models.Category.owner_id == user_id
+    ))).all()
+
+async def create_category(db: AsyncSession, category: schemas.CategoryCreate, user_id: int):
+    db_category = models.Category(
+        name=category.name,
+        owner_id=user_id
+    )
+    db.add(db_category)
+    await db.commit()
+    return db_category
+
+async def delete_category(db: AsyncSession, user_id: int, category_id: int):
+    db_category = await get_category(db, user_id, category_id)
+    if db_category:
+        task_ids = (await db.scalars(detach_category_statement(user_id, category_id))).all()
+        await db.delete(db_category)
+        await db.commit()
+        if task_ids:
+            bus.publish(user_id, "task.updated", task_ids=sorted(task_ids))
+    return db_category
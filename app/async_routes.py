@@ -0,0 +1,173 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal
+from . import async_crud, schemas, etags, pagination, projection, reminders
+from .auth import get_current_user_async
+from .database import get_async_db
+from .dependencies import task_fields, task_includes
+
+# Async versions of the hot endpoints in main.py, served when ASYNC_MODE=1.
+# main.py includes this router ahead of its own routes so these take
+# precedence; /users/ and /token stay sync because bcrypt is CPU bound.
+router = APIRouter()
+
+@router.get("/users/me/", response_model=schemas.UserProfile | schemas.User)
+async def read_users_me_async(
+    include_tasks: int = Query(0, ge=0, le=schemas.MAX_PROFILE_TASKS),
+    version: Literal["1", "2"] = "2",
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    if version == "1":
+        return schemas.User.model_validate(await async_crud.get_user_with_tasks(db, current_user.id))
+    return await async_crud.get_user_profile(db, current_user, include_tasks=include_tasks)
+
+@router.post("/tasks/", response_model=schemas.Task)
+async def create_task_async(
+    task: schemas.TaskCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    if task.category_id:
+        category = await async_crud.get_category(db, user_id=current_user.id, category_id=task.category_id)
+        if category is None:
+            raise HTTPException(status_code=400, detail="Invalid category")
+    return await async_crud.create_task(db=db, task=task, user_id=current_user.id)
+
+@router.get("/tasks/", response_model=List[schemas.Task])
+async def read_tasks_async(
+    response: Response,
+    request: Request,
+    skip: int = 0,
+    limit: int = 10,
+    completed: bool | None = Query(None),
+    category_id: int | None = Query(None),
+    search: str | None = Query(None),
+    search_description: bool = True,
+    has_reminder: bool | None = Query(None),
+    order_by: Literal["id", "deadline"] = "id",
+    cursor: str | None = Query(None),
+    include: set[str] = Depends(task_includes),
+    fields: list[str] | None = Depends(task_fields),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    try:
+        after = pagination.decode_request_cursor(cursor, order_by, search)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = dict(
+        skip=skip,
+        limit=limit,
+        completed=completed,
+        category_id=category_id,
+        search=search,
+        has_reminder=has_reminder,
+        order_by=order_by,
+        after=after,
+        search_description=search_description
+    )
+    etag = etags.collection_etag(request, current_user.id, await async_crud.get_user_version(db, current_user.id))
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
+    if fields is not None:
+        rows = await async_crud.get_task_rows(db, user_id=current_user.id, fields=fields, **filters)
+        next_cursor = pagination.next_cursor(rows, limit, order_by, search)
+        headers = {"ETag": etag}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return Response(projection.dumps(rows, fields), media_type="application/json", headers=headers)
+    tasks = await async_crud.get_tasks(db=db, user_id=current_user.id, include=include, **filters)
+    next_cursor = pagination.next_cursor(tasks, limit, order_by, search)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return tasks
+
+@router.get("/tasks/{task_id}", response_model=schemas.Task)
+async def read_task_async(
+    task_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    db_task = await async_crud.get_task(db=db, task_id=task_id, user_id=current_user.id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return db_task
+
+@router.put("/tasks/{task_id}", response_model=schemas.Task)
+async def update_task_async(
+    task_id: int,
+    task: schemas.TaskUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    if task.category_id:
+        category = await async_crud.get_category(db, user_id=current_user.id, category_id=task.category_id)
+        if category is None:
+            raise HTTPException(status_code=400, detail="Invalid category")
+    db_task = await async_crud.update_task(db=db, task_id=task_id, task=task, user_id=current_user.id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found or not authorized")
+    reminders.scheduler.sync_task(db_task)
+    return db_task
+
+@router.delete("/tasks/{task_id}", response_model=schemas.Task)
+async def delete_task_async(
+    task_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    db_task = await async_crud.delete_task(db=db, task_id=task_id, user_id=current_user.id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found or not authorized")
+    reminders.scheduler.cancel(task_id)
+    return db_task
+
+@router.put("/tasks/{task_id}/set_reminder", response_model=schemas.Task)
+async def set_reminder_async(
+    task_id: int,
+    reminder: schemas.ReminderTime,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    db_task = await async_crud.set_reminder(db=db, task_id=task_id, reminder=reminder, user_id=current_user.id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    reminders.scheduler.sync_task(db_task)
+    return db_task
+
+@router.post("/categories/", response_model=schemas.Category)
+async def create_category_async(
+    category: schemas.CategoryCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    db_category = await async_crud.get_category_by_name(db, user_id=current_user.id, name=category.name)
+    if db_category:
+        raise HTTPException(status_code=400, detail="Category already exists")
+    return await async_crud.create_category(db=db, category=category, user_id=current_user.id)
+
+@router.get("/categories/", response_model=List[schemas.Category])
+async def read_categories_async(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    etag = etags.collection_etag(request, current_user.id, await async_crud.get_user_version(db, current_user.id))
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
+    return await async_crud.get_categories(db=db, user_id=current_user.id)
+
+@router.delete("/categories/{category_id}", response_model=schemas.Category)
+async def delete_category_async(
+    category_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
+):
+    db_category = await async_crud.delete_category(db=db, user_id=current_user.id, category_id=category_id)
+    if db_category is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return db_category
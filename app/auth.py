@@ -1,10 +1,11 @@
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from . import schemas, models, crud
-from .database import get_db
+from . import schemas, models, crud, async_crud, security
+from .auth_cache import UserSnapshot, token_cache
+from .database import get_db, get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import os 
 from dotenv import load_dotenv
@@ -18,16 +19,27 @@ if SECRET_KEY is None:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return security.verify_and_update(plain_password, hashed_password)[0]
 
+# bcrypt runs with no transaction open: /token gets the writer session, whose
+# pool has a single connection that every write endpoint is waiting for.
 def authenticate_user(db: Session, email: str, password: str):
     user = crud.get_user_by_email(db, email)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
         return False
+    db.expunge(user)
+    db.rollback()
+    verified, new_hash = security.verify_and_update(password, user.hashed_password)
+    if not verified:
+        return False
+    if new_hash is not None:
+        # cost parameters changed since this hash was made
+        db.get(models.User, user.id).hashed_password = new_hash
+        db.commit()
+        user.hashed_password = new_hash
     return user
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
@@ -36,23 +48,64 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+def credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",  
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = int(payload.get("sub"))
-        if user_id is None:
-            raise credentials_exception
-    except (JWTError, ValueError):
-        raise credentials_exception
-    user = crud.get_user(db, user_id=user_id)
+        int(payload.get("sub"))
+    except (JWTError, ValueError, TypeError):
+        raise credentials_exception()
+    return payload
+
+# Subject (user id) of a bearer token, or None when it does not verify. Used
+# by admission control before the route's own authentication runs.
+def token_subject(token: str) -> int | None:
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached[1].id
+    try:
+        return int(decode_token(token)["sub"])
+    except HTTPException:
+        return None
+
+# The common case is a token seen moments ago: serve it from token_cache with
+# no signature check and no users lookup. Entries are dropped when the user
+# row changes, see auth_cache.
+
+# Plain def: FastAPI runs it in the threadpool, so the blocking user lookup
+# does not stall the event loop.
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached[1]
+    claims = decode_token(token)
+    user = crud.get_user(db, user_id=int(claims["sub"]))
     if user is None:
-        raise credentials_exception
-    return user
+        raise credentials_exception()
+    snapshot = UserSnapshot.from_user(user)
+    token_cache.put(token, claims, snapshot)
+    return snapshot
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached[1]
+    claims = decode_token(token)
+    user = await async_crud.get_user(db, user_id=int(claims["sub"]))
+    if user is None:
+        raise credentials_exception()
+    snapshot = UserSnapshot.from_user(user)
+    token_cache.put(token, claims, snapshot)
+    return snapshot
@@ -1,8 +1,10 @@
-from sqlalchemy.orm import Session
-from . import models, schemas
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+from datetime import datetime
+from sqlalchemy import and_, delete, func, insert, literal, or_, select, union_all, update
+from sqlalchemy.orm import Session, joinedload, raiseload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from . import models, schemas, fts, projection, sharding
+from .events import bus
+from .security import hash_password
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
@@ -10,14 +12,44 @@ def get_user_by_email(db: Session, email: str):
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
+def get_user_version(db: Session, user_id: int):
+    return db.scalar(select(models.UserVersion.version).where(models.UserVersion.user_id == user_id)) or 0
+
+def get_user_with_tasks(db: Session, user_id: int):
+    return db.query(models.User).filter(models.User.id == user_id).options(
+        selectinload(models.User.tasks).joinedload(models.Task.category)
+    ).first()
+
+def task_counts_statement(user_id: int):
+    return select(
+        func.coalesce(func.sum(models.TaskCounter.total), 0),
+        func.coalesce(func.sum(models.TaskCounter.completed), 0)
+    ).where(models.TaskCounter.user_id == user_id)
+
+def task_counts(total: int, completed: int):
+    return schemas.TaskCounts(total=total, completed=completed, pending=total - completed)
+
+def get_user_profile(db: Session, user, include_tasks: int = 0):
+    counts = task_counts(*db.execute(task_counts_statement(user.id)).one())
+    tasks = get_tasks(db, user_id=user.id, limit=include_tasks) if include_tasks else None
+    return schemas.UserProfile(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        is_active=user.is_active,
+        task_counts=counts,
+        tasks=tasks
+    )
+
 def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = hash_password(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
         hashed_password=hashed_password
     )
     db.add(db_user)
+    sharding.assign_shard(db, db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -36,36 +68,130 @@ def create_task(db: Session, task: schemas.TaskCreate, user_id: int):
     db.add(db_task)
     db.commit()
     db.refresh(db_task)
+    bus.publish(user_id, "task.created", task_ids=[db_task.id])
     return db_task
 
-def get_tasks(
-    db: Session,
+def tasks_statement(
     user_id: int,
     skip: int = 0,
     limit: int = 10,
     completed: bool | None = None,
     category_id: int | None = None,
     search: str | None = None,
-    has_reminder: bool | None = None
+    has_reminder: bool | None = None,
+    order_by: str = "id",
+    after: tuple | None = None,
+    search_description: bool = True
 ):
-    query = db.query(models.Task).filter(models.Task.owner_id == user_id)
+    query = select(models.Task).where(models.Task.owner_id == user_id)
     if completed is not None:
-        query = query.filter(models.Task.completed == completed)
+        query = query.where(models.Task.completed == completed)
     if category_id is not None:
-        query = query.filter(models.Task.category_id == category_id)
-    if search:
-        query = query.filter(models.Task.title.ilike(f"%{search}%"))
-        
+        query = query.where(models.Task.category_id == category_id)
     if has_reminder is True:
-        query = query.filter(models.Task.reminder_time != None)  
+        query = query.where(models.Task.reminder_time != None)  
     elif has_reminder is False:
-        query = query.filter(models.Task.reminder_time == None)
-    
-    return query.offset(skip).limit(limit).all()
+        query = query.where(models.Task.reminder_time == None)
+
+    if search:
+        match_query = fts.build_match_query(search, user_id, search_description)
+        if match_query is None:
+            # nothing the tokenizer can index, e.g. punctuation only
+            query = query.where(models.Task.title.ilike(f"%{search}%"))
+        else:
+            query = query.join(fts.tasks_fts, fts.tasks_fts.c.rowid == models.Task.id)
+            query = query.where(fts.matches(match_query))
+            query = query.order_by(fts.tasks_fts.c.rank, models.Task.id)
+            return query.offset(skip).limit(limit)
+
+    sort_column = getattr(models.Task, order_by)
+    # SQLite sorts NULLs first, which _after_condition relies on
+    query = query.order_by(sort_column, models.Task.id)
+    if after is not None:
+        query = query.where(_after_condition(sort_column, *after))
+    else:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+# Relationships a task response may embed. Anything not requested is never
+# loaded, so serializing a page of tasks cannot fall back to lazy loads.
+TASK_INCLUDES = ("category",)
+
+def task_loader_options(include=TASK_INCLUDES):
+    return [
+        joinedload(models.Task.category) if "category" in include else raiseload(models.Task.category)
+    ]
+
+def omit_excluded(tasks, include=TASK_INCLUDES):
+    for name in set(TASK_INCLUDES) - set(include):
+        for task in tasks:
+            set_committed_value(task, name, None)
+    return tasks
+
+def get_tasks(db: Session, user_id: int, include=TASK_INCLUDES, **filters):
+    statement = tasks_statement(user_id, **filters).options(*task_loader_options(include))
+    return omit_excluded(db.scalars(statement).all(), include)
+
+
+def get_task_rows(db: Session, user_id: int, fields, **filters):
+    statement = projection.select_fields(tasks_statement(user_id, **filters), fields, filters.get("order_by", "id"))
+    return db.execute(statement).all()
+
+
+def export_task_partitions(db: Session, user_id: int, batch_size: int):
+    statement = projection.select_fields(tasks_statement(user_id, limit=None), projection.TASK_FIELDS)
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    return result.partitions()
+
+
+# One UNION over tasks and tombstones so both are read from the same
+# snapshot; a page never skips a sequence number that is still uncommitted
+# on one side. Both arms are range scans on (owner_id, change_seq).
+def get_task_changes(db: Session, user_id: int, since: int, limit: int):
+    changed = union_all(
+        select(models.Task.change_seq.label("seq"), models.Task.id.label("task_id"), literal(False).label("deleted"))
+        .where(models.Task.owner_id == user_id, models.Task.change_seq > since),
+        select(models.TaskTombstone.change_seq, models.TaskTombstone.task_id, literal(True))
+        .where(models.TaskTombstone.owner_id == user_id, models.TaskTombstone.change_seq > since)
+    ).order_by("seq").limit(limit + 1)
+    rows = db.execute(changed).all()
+    page = rows[:limit]
+    tasks = {
+        task.id: task
+        for task in db.scalars(
+            select(models.Task)
+            .where(models.Task.id.in_([row.task_id for row in page if not row.deleted]))
+            .options(*task_loader_options())
+        )
+    }
+    return schemas.TaskChanges(
+        # a task deleted since the union ran shows up as a tombstone next page
+        changes=[tasks[row.task_id] for row in page if not row.deleted and row.task_id in tasks],
+        deleted=[row.task_id for row in page if row.deleted],
+        next_since=page[-1].seq if page else since,
+        has_more=len(rows) > limit
+    )
+
+
+def _after_condition(sort_column, last_value, last_id):
+    if sort_column is models.Task.id:
+        return models.Task.id > last_id
+    if last_value is None:
+        return or_(
+            sort_column != None,
+            and_(sort_column == None, models.Task.id > last_id)
+        )
+    return or_(
+        sort_column > last_value,
+        and_(sort_column == last_value, models.Task.id > last_id)
+    )
 
 
 def get_task(db: Session, task_id: int, user_id: int):
-    return db.query(models.Task).filter(models.Task.id == task_id, models.Task.owner_id == user_id).first()
+    return db.query(models.Task).filter(models.Task.id == task_id, models.Task.owner_id == user_id).options(
+        *task_loader_options()
+    ).first()
 
 def update_task(db: Session, task_id: int, task: schemas.TaskUpdate, user_id: int):
     update_data = task.model_dump(exclude_unset=True)
@@ -78,6 +204,7 @@ def update_task(db: Session, task_id: int, task: schemas.TaskUpdate, user_id: in
         return None
     
     db.commit()
+    bus.publish(user_id, "task.updated", task_ids=[task_id])
     db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
     return db_task
 
@@ -87,6 +214,7 @@ def delete_task(db: Session, task_id: int, user_id: int):
         return None
     db.delete(db_task)
     db.commit()
+    bus.publish(user_id, "task.deleted", task_ids=[task_id])
     return db_task
 
 def get_category_by_name(db: Session, user_id: int, name: str):
@@ -116,9 +244,166 @@ def create_category(db: Session, category: schemas.CategoryCreate, user_id: int)
     db.refresh(db_category)
     return db_category
 
+def detach_category_statement(user_id: int, category_id: int):
+    # tasks of a deleted category become uncategorized; the counters follow
+    # through the tasks_counters_au trigger in the same transaction
+    return (
+        update(models.Task)
+        .where(models.Task.owner_id == user_id, models.Task.category_id == category_id)
+        .values(category_id=None)
+        .returning(models.Task.id)
+        .execution_options(synchronize_session=False)
+    )
+
 def delete_category(db: Session, user_id: int, category_id: int):
     db_category = get_category(db, user_id, category_id)
     if db_category:
+        task_ids = db.scalars(detach_category_statement(user_id, category_id)).all()
         db.delete(db_category)
         db.commit()
-    return db_category
\ No newline at end of file
+        if task_ids:
+            bus.publish(user_id, "task.updated", task_ids=sorted(task_ids))
+    return db_category
+
+def get_task_stats(db: Session, user_id: int, now: datetime):
+    rows = db.execute(
+        select(models.TaskCounter.category_id, models.Category.name, models.TaskCounter.total, models.TaskCounter.completed)
+        .outerjoin(models.Category, models.Category.id == models.TaskCounter.category_id)
+        .where(models.TaskCounter.user_id == user_id, models.TaskCounter.total > 0)
+        .order_by(models.TaskCounter.category_id)
+    ).all()
+    # deadlines move relative to now, so overdue is counted on the partial
+    # ix_tasks_open_deadlines index rather than kept as a counter
+    overdue = db.scalar(select(func.count()).where(
+        models.Task.owner_id == user_id,
+        models.Task.completed == False,
+        models.Task.deadline < now
+    ))
+    categories = [
+        schemas.CategoryStats(
+            category_id=category_id or None,
+            name=name,
+            total=total,
+            completed=completed,
+            pending=total - completed
+        )
+        for category_id, name, total, completed in rows
+    ]
+    total = sum(c.total for c in categories)
+    completed = sum(c.completed for c in categories)
+    return schemas.TaskStats(
+        **task_counts(total, completed).model_dump(),
+        overdue=overdue,
+        categories=categories
+    )
+
+def get_category_ids(db: Session, user_id: int, category_ids):
+    if not category_ids:
+        return set()
+    return set(db.scalars(select(models.Category.id).where(
+        models.Category.owner_id == user_id,
+        models.Category.id.in_(category_ids)
+    )))
+
+def get_category_ids_by_name(db: Session, user_id: int):
+    return dict(db.execute(select(models.Category.name, models.Category.id).where(
+        models.Category.owner_id == user_id
+    )).all())
+
+def get_task_ids(db: Session, user_id: int, task_ids):
+    if not task_ids:
+        return set()
+    return set(db.scalars(select(models.Task.id).where(
+        models.Task.owner_id == user_id,
+        models.Task.id.in_(task_ids)
+    )))
+
+def get_tasks_by_ids(db: Session, user_id: int, task_ids):
+    if not task_ids:
+        return []
+    return db.scalars(select(models.Task).where(
+        models.Task.owner_id == user_id,
+        models.Task.id.in_(task_ids)
+    )).all()
+
+# The bulk functions validate every item up front (one query for categories,
+# one for task ownership), apply the valid ones as a single executemany in
+# one transaction and report the rest as per-item errors. An id repeated
+# within one request is applied once and its repeats reported as errors.
+
+def task_row(task: schemas.TaskCreate, user_id: int):
+    return dict(
+        title=task.title,
+        description=task.description,
+        completed=task.completed,
+        deadline=task.deadline,
+        owner_id=user_id,
+        category_id=task.category_id,
+        reminder_time=None,
+        reminder_sent=False
+    )
+
+def insert_task_rows(db: Session, rows: list[dict]):
+    db.execute(insert(models.Task), rows)
+    db.commit()
+    return len(rows)
+
+def create_tasks_bulk(db: Session, tasks: list[schemas.TaskCreate], user_id: int):
+    valid_categories = get_category_ids(db, user_id, {t.category_id for t in tasks if t.category_id})
+    rows, errors = [], []
+    for index, task in enumerate(tasks):
+        if task.category_id and task.category_id not in valid_categories:
+            errors.append(schemas.BulkItemError(index=index, detail="Invalid category"))
+            continue
+        rows.append(task_row(task, user_id))
+    ids = []
+    if rows:
+        ids = db.scalars(
+            insert(models.Task).returning(models.Task.id, sort_by_parameter_order=True),
+            rows
+        ).all()
+        db.commit()
+        bus.publish(user_id, "task.created", task_ids=ids)
+    return schemas.BulkResult(ids=ids, errors=errors)
+
+def update_tasks_bulk(db: Session, tasks: list[schemas.TaskBulkUpdate], user_id: int):
+    owned = get_task_ids(db, user_id, {t.id for t in tasks})
+    valid_categories = get_category_ids(db, user_id, {t.category_id for t in tasks if t.category_id})
+    rows, errors, seen = [], [], set()
+    for index, task in enumerate(tasks):
+        if task.id in seen:
+            errors.append(schemas.BulkItemError(index=index, id=task.id, detail="Duplicate id"))
+            continue
+        seen.add(task.id)
+        if task.id not in owned:
+            errors.append(schemas.BulkItemError(index=index, id=task.id, detail="Task not found or not authorized"))
+            continue
+        if task.category_id and task.category_id not in valid_categories:
+            errors.append(schemas.BulkItemError(index=index, id=task.id, detail="Invalid category"))
+            continue
+        rows.append(task.model_dump(exclude_unset=True) | {"id": task.id})
+    if rows:
+        # ORM bulk UPDATE by primary key: one executemany per distinct set of columns
+        db.execute(update(models.Task), rows)
+        db.commit()
+        bus.publish(user_id, "task.updated", task_ids=[row["id"] for row in rows])
+    return schemas.BulkResult(ids=[row["id"] for row in rows], errors=errors)
+
+def delete_tasks_bulk(db: Session, task_ids: list[int], user_id: int):
+    owned = get_task_ids(db, user_id, set(task_ids))
+    errors, seen = [], set()
+    for index, task_id in enumerate(task_ids):
+        if task_id in seen:
+            errors.append(schemas.BulkItemError(index=index, id=task_id, detail="Duplicate id"))
+        elif task_id not in owned:
+            errors.append(schemas.BulkItemError(index=index, id=task_id, detail="Task not found or not authorized"))
+        seen.add(task_id)
+    if owned:
+        db.execute(
+            delete(models.Task)
+            .where(models.Task.owner_id == user_id, models.Task.id.in_(owned))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        bus.publish(user_id, "task.deleted", task_ids=sorted(owned))
+    return schemas.BulkResult(ids=sorted(owned), errors=errors)
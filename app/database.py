@@ -1,21 +1,131 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import Session
+from fastapi import Request
+from dotenv import load_dotenv
+from .migrations import migrate
+from . import profiling
+from .metrics import instrument_engine
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./todos.db"
+load_dotenv()
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./todos.db")
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+)
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str(os.cpu_count() or 4)))
+# Comma-separated shard database URLs. When set, DATABASE_URL only holds the
+# users directory and each user's tasks and categories live in one shard; see
+# app/sharding.py.
+SHARD_DATABASE_URLS = [url.strip() for url in os.getenv("SHARD_DATABASE_URLS", "").split(",") if url.strip()]
+SHARDED = bool(SHARD_DATABASE_URLS)
+
+# Applied to every new connection. WAL lets readers run alongside the single
+# writer; synchronous=NORMAL is durable across application crashes in WAL mode.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),
+}
+
+# Serve the task, category and /users/me endpoints from app/async_routes.py
+ASYNC_MODE = os.getenv("ASYNC_MODE", "0") == "1"
+
+def _is_memory(url: str) -> bool:
+    return url.endswith(":memory:") or url.rstrip("/").endswith("sqlite:")
+
+def _pragma_listener(read_only: bool):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+    return set_pragmas
+
+def make_engine(url: str, read_only: bool = False, pool_size: int = 1):
+    if _is_memory(url):
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            pool_size=pool_size,
+            max_overflow=0
+        )
+    event.listen(engine, "connect", _pragma_listener(read_only))
+    return engine
+
+def make_async_engine(url: str):
+    async_engine = create_async_engine(url)
+    event.listen(async_engine.sync_engine, "connect", _pragma_listener(False))
+    return async_engine
+
+# SQLite allows one writer at a time, so writes share a single connection
+# instead of queueing on the database lock; reads get their own pool.
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = make_engine(SQLALCHEMY_DATABASE_URL, read_only=True, pool_size=READ_POOL_SIZE)
+async_engine = make_async_engine(ASYNC_DATABASE_URL)
+instrument_engine(engine, "write")
+instrument_engine(read_engine, "read")
+instrument_engine(async_engine.sync_engine, "async")
+for _engine in (engine, read_engine, async_engine.sync_engine):
+    profiling.instrument_engine(_engine)
+
+shard_engines = [make_engine(url) for url in SHARD_DATABASE_URLS]
+shard_read_engines = [make_engine(url, read_only=True, pool_size=READ_POOL_SIZE) for url in SHARD_DATABASE_URLS]
+shard_async_engines = [
+    make_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://", 1)) for url in SHARD_DATABASE_URLS
+]
+for _shard, _engines in enumerate(zip(shard_engines, shard_read_engines, shard_async_engines)):
+    for _name, _engine in zip(("write", "read", "async"), _engines):
+        _engine = getattr(_engine, "sync_engine", _engine)
+        instrument_engine(_engine, f"shard{_shard}-{_name}")
+        profiling.instrument_engine(_engine)
+# Where tasks and categories are stored. When sharded the directory keeps the
+# rows of users not yet moved into a shard.
+task_engines = [engine, *shard_engines]
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# Objects stay usable after commit; lazy loads are not possible in async code.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
-def get_db():
-    db = SessionLocal()
+# Every database gets the full schema, the directory and shards included.
+def init_db(bind=None):
+    from . import models  # registers the tables on Base.metadata
+    for target in [bind] if bind is not None else [engine, *shard_engines]:
+        Base.metadata.create_all(bind=target)
+        migrate(target)
+
+READ_METHODS = {"GET", "HEAD"}
+
+def get_db(request: Request):
+    read_only = request.method in READ_METHODS
+    if SHARDED:
+        from .sharding import request_session
+        db = request_session(request, read_only)
+    else:
+        db = ReadSessionLocal() if read_only else SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db(request: Request):
+    if SHARDED:
+        from .sharding import request_async_session
+        session = request_async_session(request)
+    else:
+        session = AsyncSessionLocal()
+    async with session as db:
+        yield db
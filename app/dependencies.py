@@ -0,0 +1,30 @@
+import hmac
+from fastapi import Header, HTTPException, Query
+from . import crud, profiling, projection
+
+# Query parameters shared by the sync routes in main.py and the async routes.
+
+def task_includes(
+    include: str = Query("category", description="Comma-separated relationships to embed; empty for none")
+):
+    names = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = names - set(crud.TASK_INCLUDES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(sorted(unknown))}")
+    return names
+
+def task_fields(
+    fields: str | None = Query(None, description="Comma-separated task fields; returns only these, bypassing the ORM")
+):
+    if fields is None:
+        return None
+    try:
+        return projection.parse_fields(fields)
+    except projection.InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Admin endpoints answer 404 unless ADMIN_TOKEN is configured and sent as
+# X-Admin-Token, so they are invisible on deployments that do not use them.
+def require_admin(x_admin_token: str | None = Header(None)):
+    if not profiling.ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, profiling.ADMIN_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
@@ -1,30 +1,242 @@
 import os
+import queue
 import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from typing import Callable
+from .metrics import registry
 
-def send_email(to_email: str, subject: str, content: str):
-    try:
-        smtp_host = os.getenv('EMAIL_HOST')
-        smtp_port = os.getenv('EMAIL_PORT')
-        smtp_user = os.getenv('EMAIL_USER')
-        smtp_password = os.getenv('EMAIL_PASSWORD')
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", "4"))
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", str(EMAIL_POOL_SIZE)))
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "10000"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "3"))
+EMAIL_RETRY_BACKOFF = float(os.getenv("EMAIL_RETRY_BACKOFF_SECONDS", "1"))
+# Connections idle longer than this get a NOOP before reuse.
+EMAIL_IDLE_CHECK_SECONDS = float(os.getenv("EMAIL_IDLE_CHECK_SECONDS", "30"))
+
+
+def smtp_connect():
+    smtp_host = os.getenv('EMAIL_HOST')
+    smtp_port = os.getenv('EMAIL_PORT')
+    smtp_user = os.getenv('EMAIL_USER')
+    smtp_password = os.getenv('EMAIL_PASSWORD')
 
-        server = smtplib.SMTP(smtp_host, smtp_port)
+    server = smtplib.SMTP(smtp_host, smtp_port, timeout=30)
+    if os.getenv('EMAIL_STARTTLS', '1') == '1':
         server.starttls()
+    if smtp_user:
         server.login(smtp_user, smtp_password)
+    return server
+
+
+def build_message(to_email: str, subject: str, content: str):
+    msg = MIMEMultipart()
+    msg['From'] = os.getenv('EMAIL_FROM') or os.getenv('EMAIL_USER')
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(content, 'html'))
+    return msg
+
+
+# Keeps up to size authenticated SMTP connections open between messages, so
+# STARTTLS and login happen once per connection instead of once per email.
+class SMTPConnectionPool:
+    def __init__(self, size: int = EMAIL_POOL_SIZE, connect: Callable = smtp_connect):
+        self.size = size
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            server = self._checkout()
+            try:
+                yield server
+            except Exception:
+                self._discard(server)
+                raise
+            self._idle.put((server, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < EMAIL_IDLE_CHECK_SECONDS:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except Exception:
+                pass
+            self._discard(server)
+
+    def _discard(self, server):
+        try:
+            server.close()
+        except Exception:
+            pass
+
+
+@dataclass
+class OutgoingEmail:
+    to_email: str
+    subject: str
+    content: str
+    on_sent: Callable | None = None
+    on_failed: Callable | None = None
+    # checked before every attempt; returning False drops the message
+    before_send: Callable | None = None
+
 
-        msg = MIMEMultipart()
-        msg['From'] = smtp_user
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(content, 'html'))
+# Bounded queue drained by worker threads that share an SMTPConnectionPool.
+# Each message gets up to max_attempts tries with exponential backoff; its
+# on_sent/on_failed callback runs in the worker once the outcome is known.
+# When no workers are running (scripts, tests) submit() delivers inline.
+class MailQueue:
+    def __init__(
+        self,
+        pool: SMTPConnectionPool,
+        workers: int = EMAIL_WORKERS,
+        maxsize: int = EMAIL_QUEUE_SIZE,
+        max_attempts: int = EMAIL_MAX_ATTEMPTS,
+        backoff: float = EMAIL_RETRY_BACKOFF
+    ):
+        self.pool = pool
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._started_at = None
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.skipped = 0
 
-        server.send_message(msg)
-        server.quit()
+    def submit(self, email: OutgoingEmail, block: bool = True, timeout: float | None = None):
+        with self._lock:
+            self.submitted += 1
+        if not self._threads:
+            self._deliver(email)
+            return
+        self._queue.put(email, block=block, timeout=timeout)
 
+    def start(self):
+        self._started_at = time.monotonic()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"mail-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.pool.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self._started_at if self._started_at else 0
+            return {
+                "queued": self._queue.qsize(),
+                "submitted": self.submitted,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": self.retried,
+                "skipped": self.skipped,
+                "sent_per_second": self.sent / elapsed if elapsed else 0.0,
+            }
+
+    def _work(self):
+        while True:
+            email = self._queue.get()
+            if email is None:
+                return
+            self._deliver(email)
+
+    def _deliver(self, email: OutgoingEmail):
+        message = build_message(email.to_email, email.subject, email.content)
+        for attempt in range(self.max_attempts):
+            if not self._still_wanted(email):
+                with self._lock:
+                    self.skipped += 1
+                return
+            try:
+                with self.pool.connection() as server:
+                    server.send_message(message)
+            except Exception as e:
+                print(f"Failed to send email to {email.to_email} (attempt {attempt + 1}): {e}")
+                if attempt + 1 < self.max_attempts:
+                    with self._lock:
+                        self.retried += 1
+                    time.sleep(self.backoff * 2 ** attempt)
+                continue
+            with self._lock:
+                self.sent += 1
+            self._callback(email.on_sent)
+            return
+        with self._lock:
+            self.failed += 1
+        self._callback(email.on_failed)
+
+    def _still_wanted(self, email: OutgoingEmail) -> bool:
+        if email.before_send is None:
+            return True
+        try:
+            return email.before_send()
+        except Exception as e:
+            print(f"Email check failed, not sending to {email.to_email}: {e}")
+            return False
+
+    def _callback(self, callback):
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            print(f"Email callback failed: {e}")
+
+
+mail_queue = MailQueue(SMTPConnectionPool())
+
+registry.callback("email_queued", "Emails waiting for a mail worker", lambda: mail_queue.stats()["queued"])
+registry.callback("email_sent_total", "Emails accepted by the SMTP server", lambda: mail_queue.sent, "counter")
+registry.callback("email_failed_total", "Emails that exhausted their retries", lambda: mail_queue.failed, "counter")
+registry.callback("email_retried_total", "Email delivery attempts that were retried", lambda: mail_queue.retried, "counter")
+registry.callback("email_skipped_total", "Emails dropped because they were no longer wanted", lambda: mail_queue.skipped, "counter")
+
+
+def send_email(to_email: str, subject: str, content: str):
+    try:
+        with mail_queue.pool.connection() as server:
+            server.send_message(build_message(to_email, subject, content))
         return "Email sent successfully"
-    
+
     except Exception as e:
         print(f"Failed to send email: {str(e)}")
         return None
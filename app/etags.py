@@ -0,0 +1,31 @@
+import hashlib
+from fastapi import Request, Response
+
+# Weak validators for per-user collections. The user's version (see
+# models.UserVersion) changes with every write to their tasks or categories;
+# hashing in the path and query keeps different pages and filters apart.
+
+
+def collection_etag(request: Request, user_id: int, version: int) -> str:
+    query = "&".join(sorted(str(request.query_params).split("&")))
+    digest = hashlib.blake2b(f"{user_id}:{request.url.path}?{query}".encode(), digest_size=8).hexdigest()
+    return f'W/"{version}-{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(",")}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+from collections import deque
+import orjson
+from .metrics import registry
+
+# Events a subscriber may have waiting before it is considered too slow; it
+# then gets a single resync event and should catch up via /tasks/changes.
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "100"))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+
+RESYNC = orjson.dumps({"type": "resync"})
+
+
+# One connected client. Events are pushed from any thread but only ever
+# touched on the subscriber's event loop; an idle subscription is an empty
+# deque and an unset asyncio.Event.
+class Subscription:
+    __slots__ = ("user_id", "maxsize", "overflowed", "_loop", "_buffer", "_ready")
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.overflowed = False
+        self._loop = loop
+        self._buffer = deque()
+        self._ready = asyncio.Event()
+
+    def push(self, event: bytes):
+        try:
+            self._loop.call_soon_threadsafe(self._append, event)
+        except RuntimeError:
+            # the subscriber's loop has closed
+            pass
+
+    def _append(self, event: bytes):
+        if self.overflowed:
+            return
+        if len(self._buffer) >= self.maxsize:
+            self._buffer.clear()
+            self.overflowed = True
+        else:
+            self._buffer.append(event)
+        self._ready.set()
+
+    async def get(self, timeout: float | None = None) -> list[bytes]:
+        if not self._buffer and not self.overflowed:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        if self.overflowed:
+            self.overflowed = False
+            return [RESYNC]
+        events = list(self._buffer)
+        self._buffer.clear()
+        return events
+
+
+# In-process pub/sub keyed by user id. publish() serializes each event once
+# and is safe to call from request threads, mail workers and the event loop
+# alike. Subscribers only see events published by this process.
+class EventBus:
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id: int, type: str, **data):
+        with self._lock:
+            self.published += 1
+            subscriptions = tuple(self._subscribers.get(user_id, ()))
+        if not subscriptions:
+            return
+        event = orjson.dumps({"type": type, **data})
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    async def sse(self, subscription: Subscription, is_disconnected, heartbeat: float = EVENT_HEARTBEAT_SECONDS):
+        try:
+            yield b": connected\n\n"
+            while not await is_disconnected():
+                events = await subscription.get(timeout=heartbeat)
+                if not events:
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"".join(b"data: " + event + b"\n\n" for event in events)
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._subscribers),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                "published": self.published,
+            }
+
+
+bus = EventBus()
+
+registry.callback("event_subscribers", "Open /events streams", lambda: bus.stats()["subscribers"])
+registry.callback("events_published_total", "Events published to the bus", lambda: bus.published, "counter")
@@ -0,0 +1,80 @@
+import csv
+import io
+import os
+import zlib
+from datetime import datetime
+import orjson
+from . import projection
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_FIELDS = list(projection.TASK_FIELDS)
+_CATEGORY = EXPORT_FIELDS.index("category")
+# CSV is flat: the embedded category becomes its name.
+CSV_HEADER = EXPORT_FIELDS[:_CATEGORY] + ["category_name"] + EXPORT_FIELDS[_CATEGORY + 1:]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+# Each generator encodes one yield_per partition at a time, so memory stays
+# flat however many tasks the account has and the first bytes go out as soon
+# as the first partition is fetched.
+def ndjson_chunks(partitions):
+    for rows in partitions:
+        yield b"".join(orjson.dumps(item) + b"\n" for item in projection.to_dicts(rows, EXPORT_FIELDS))
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def csv_chunks(partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for rows in partitions:
+        writer.writerows(
+            [_csv_value(value) for value in row[:_CATEGORY + 1] + row[_CATEGORY + 3:]]
+            for row in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+# Whether an Accept-Encoding header allows gzip: listed (or covered by "*")
+# with a non-zero q value. An explicit gzip entry overrides "*".
+def accepts_gzip(accept_encoding: str) -> bool:
+    qualities = {}
+    for entry in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in entry.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        # sync flush so every partition reaches the client without waiting
+        # for the compressor's window to fill
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def encode(partitions, format: str, gzip: bool = False):
+    chunks = ndjson_chunks(partitions) if format == "ndjson" else csv_chunks(partitions)
+    return gzip_chunks(chunks) if gzip else chunks
@@ -0,0 +1,24 @@
+import re
+from sqlalchemy import column, literal_column, table
+
+# tasks_fts is an external-content FTS5 index over tasks(title, description,
+# owner_id), created and kept in sync by triggers in app/migrations.py. It is not part of
+# Base.metadata because create_all() cannot build virtual tables.
+tasks_fts = table("tasks_fts", column("rowid"), column("rank"))
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(search: str, owner_id: int, include_description: bool = True) -> str | None:
+    terms = _TERM.findall(search)
+    if not terms:
+        return None
+    # every term must match, each as a prefix: "buy milk" -> "buy"* "milk"*
+    expression = " ".join(f'"{term}"*' for term in terms)
+    columns = "{title description}" if include_description else "{title}"
+    # the owner token narrows the index to one user's rows before ranking
+    return f'owner_id : "{int(owner_id)}" AND {columns} : ({expression})'
+
+
+def matches(match_query: str):
+    return literal_column("tasks_fts").op("MATCH")(match_query)
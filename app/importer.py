@@ -0,0 +1,88 @@
+import codecs
+import csv
+import os
+import orjson
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from . import crud, schemas
+from .events import bus
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+# Line errors reported back in full; the rest are only counted.
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+
+def ndjson_records(file):
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, record, None
+
+
+def csv_records(file):
+    reader = csv.DictReader(file)
+    for row in reader:
+        # empty cells mean "not set", as they do in the export
+        yield reader.line_num, {key: value for key, value in row.items() if value != ""}, None
+
+
+def _category_name(record: dict):
+    category = record.pop("category", None)
+    if isinstance(category, dict):
+        category = category.get("name")
+    return record.pop("category_name", None) or category
+
+
+# Reads records one at a time from the (spooled) upload, validates each
+# against TaskCreate and inserts them IMPORT_CHUNK_SIZE rows per transaction.
+# Category names are resolved through one query for the user's categories;
+# names not seen before are created and added to that map.
+def import_tasks(db: Session, user_id: int, file, format: str, chunk_size: int = IMPORT_CHUNK_SIZE):
+    text = codecs.getreader("utf-8-sig")(file, errors="replace")
+    records = ndjson_records(text) if format == "ndjson" else csv_records(text)
+    categories = crud.get_category_ids_by_name(db, user_id)
+    category_ids = set(categories.values())
+    result = schemas.ImportResult()
+    chunk = []
+
+    def fail(line_number, detail):
+        result.failed += 1
+        if len(result.errors) < IMPORT_MAX_ERRORS:
+            result.errors.append(schemas.ImportLineError(line=line_number, detail=detail))
+
+    for line_number, record, error in records:
+        if error:
+            fail(line_number, error)
+            continue
+        name = _category_name(record)
+        try:
+            task = schemas.TaskCreate.model_validate(record)
+        except ValidationError as e:
+            fail(line_number, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        if name:
+            if name not in categories:
+                categories[name] = crud.create_category(db, schemas.CategoryCreate(name=name), user_id).id
+                category_ids.add(categories[name])
+            task.category_id = categories[name]
+        elif task.category_id and task.category_id not in category_ids:
+            fail(line_number, "Invalid category")
+            continue
+        chunk.append(crud.task_row(task, user_id))
+        if len(chunk) >= chunk_size:
+            result.imported += crud.insert_task_rows(db, chunk)
+            chunk = []
+    if chunk:
+        result.imported += crud.insert_task_rows(db, chunk)
+    if result.imported:
+        # too many ids to list; clients catch up through /tasks/changes
+        bus.publish(user_id, "task.imported", count=result.imported)
+    return result
@@ -1,62 +1,251 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Body, Depends, File, HTTPException, status, Query, Request, Response, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import List
+from typing import List, Literal
 from datetime import timedelta, datetime
-from . import crud, schemas, auth, models
-from .database import get_db, init_db
+import time
+from . import crud, schemas, auth, models, etags, pagination, projection, async_routes, security, reminders
+from .database import get_db, init_db, engine, read_engine, SessionLocal, ASYNC_MODE, SHARDED, task_engines
 from .auth import get_current_user
-from app.email_utils import send_email
+from .dependencies import require_admin, task_fields, task_includes
+from . import admission, email_utils, events, export, importer, metrics, profiling, sharding
 from contextlib import asynccontextmanager
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-
-def check_reminders():
-    db = next(get_db())  
-    tasks = db.query(models.Task).filter(
-        models.Task.reminder_time <= datetime.now(),
-        models.Task.reminder_sent == False,
-        models.Task.completed == False
-    ).all()
-
-    for task in tasks:
-        try:
-            send_email(
-                to_email=task.owner.email,
-                subject=f"Reminder: {task.title}",
-                content=f"This is a reminder for your task: {task.title}. Deadline: {task.deadline}"
-            )
-            task.reminder_sent = True  
-        except Exception as e:
-            print(f"Error sending email for task {task.id}: {e}")
-    
-    db.commit() 
+from functools import partial
+
+def check_reminders(task_ids: list[int] | None = None, bind=None):
+    start = time.perf_counter()
+    try:
+        if bind is None and SHARDED:
+            # emails from the read pool: a request may hold the directory's
+            # write connection while it waits for this shard's
+            for task_engine in task_engines:
+                _check_reminders(task_ids, task_engine, directory=read_engine)
+        else:
+            _check_reminders(task_ids, bind or engine)
+    except Exception:
+        metrics.reminder_jobs.inc("error")
+        raise
+    else:
+        metrics.reminder_jobs.inc("ok")
+    finally:
+        metrics.reminder_job_latency.observe(time.perf_counter() - start)
+
+
+def _check_reminders(task_ids: list[int] | None, bind, directory=None):
+    owner = reminders.LEASE_OWNER
+    while True:
+        now = datetime.now()
+        with bind.begin() as conn:
+            if directory is None:
+                claimed = reminders.claim_reminders(conn, owner, now, task_ids)
+            else:
+                with directory.connect() as users:
+                    claimed = reminders.claim_reminders(conn, owner, now, task_ids, directory=users)
+            if task_ids is not None:
+                # another worker is on these; look again when its lease runs out
+                for task_id, lease_expires in reminders.leased_elsewhere(conn, owner, now, task_ids):
+                    reminders.scheduler.schedule(task_id, lease_expires)
+
+        metrics.reminders_claimed.inc(amount=len(claimed))
+        # Delivery happens on the mail workers; each attempt first renews the
+        # lease and is dropped if it ran out, so a reminder taken over by
+        # another worker is not sent twice. Each reminder is marked sent on
+        # its own once the SMTP server accepts it, or released and retried
+        # later if it fails.
+        for task_id, title, deadline, user_id, email in claimed:
+            email_utils.mail_queue.submit(email_utils.OutgoingEmail(
+                to_email=email,
+                subject=f"Reminder: {title}",
+                content=f"This is a reminder for your task: {title}. Deadline: {deadline}",
+                on_sent=partial(_reminder_sent, bind, owner, task_id, user_id),
+                on_failed=partial(_release_and_retry, bind, owner, task_id),
+                before_send=partial(reminders.renew_lease, bind, owner, task_id)
+            ))
+        if task_ids is not None or len(claimed) < reminders.REMINDER_BATCH_SIZE:
+            return
+
+
+def _reminder_sent(bind, owner: str, task_id: int, user_id: int):
+    reminders.complete_reminder(bind, owner, task_id)
+    metrics.reminders_sent.inc()
+    events.bus.publish(user_id, "reminder.fired", task_ids=[task_id])
+
+
+def _release_and_retry(bind, owner: str, task_id: int):
+    metrics.reminders_failed.inc()
+    reminders.release_reminder(bind, owner, task_id)
+    reminders.scheduler.retry([task_id])
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
 
-    scheduler = BackgroundScheduler()
-    scheduler.start()
-
-    scheduler.add_job(
-        check_reminders,
-        trigger=IntervalTrigger(seconds=60)
-    )
+    for task_engine in task_engines:
+        db = SessionLocal(bind=task_engine)
+        try:
+            reminders.scheduler.load(db)
+        finally:
+            db.close()
+    email_utils.mail_queue.start()
+    reminders.scheduler.start(check_reminders)
 
     yield
 
-    scheduler.shutdown()
+    reminders.scheduler.stop()
+    email_utils.mail_queue.stop()
+    security.hasher.shutdown()
 
 app = FastAPI(lifespan=lifespan)
+# metrics is added last, so it is outermost and also counts shed requests
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.exception_handler(security.PasswordHasherBusy)
+def password_hasher_busy(request: Request, exc: security.PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many concurrent logins, try again shortly"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(sharding.ShardUnavailable)
+def shard_unavailable(request: Request, exc: sharding.ShardUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Your data is being moved, try again shortly"},
+        headers={"Retry-After": "5"}
+    )
+
+# Fixed /tasks/<name> paths are registered before the async router and the
+# /tasks/{task_id} routes, which would otherwise capture the name as a task id.
+
+@app.post("/tasks/bulk", response_model=schemas.BulkResult)
+def create_tasks_bulk(
+    tasks: List[schemas.TaskCreate] = Body(max_length=schemas.MAX_BULK_ITEMS),
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    return crud.create_tasks_bulk(db=db, tasks=tasks, user_id=current_user.id)
+
+@app.patch("/tasks/bulk", response_model=schemas.BulkResult)
+def update_tasks_bulk(
+    tasks: List[schemas.TaskBulkUpdate] = Body(max_length=schemas.MAX_BULK_ITEMS),
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    result = crud.update_tasks_bulk(db=db, tasks=tasks, user_id=current_user.id)
+    for task in crud.get_tasks_by_ids(db, current_user.id, result.ids):
+        reminders.scheduler.sync_task(task)
+    return result
+
+@app.delete("/tasks/bulk", response_model=schemas.BulkResult)
+def delete_tasks_bulk(
+    body: schemas.TaskBulkIds,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    result = crud.delete_tasks_bulk(db=db, task_ids=body.ids, user_id=current_user.id)
+    for task_id in result.ids:
+        reminders.scheduler.cancel(task_id)
+    return result
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/slow-queries", dependencies=[Depends(require_admin)], include_in_schema=False)
+def read_slow_queries(limit: int = Query(100, ge=1)):
+    if profiling.slow_queries is None:
+        raise HTTPException(status_code=404, detail="Slow query logging is disabled; set SLOW_QUERY_MS")
+    return {"threshold_ms": profiling.slow_queries.threshold_ms, "queries": profiling.slow_queries.entries(limit)}
+
+@app.delete("/admin/slow-queries", dependencies=[Depends(require_admin)], include_in_schema=False)
+def clear_slow_queries():
+    if profiling.slow_queries is not None:
+        profiling.slow_queries.clear()
+    return Response(status_code=204)
+
+@app.get("/tasks/stats", response_model=schemas.TaskStats)
+def read_task_stats(
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    return crud.get_task_stats(db, user_id=current_user.id, now=datetime.now())
+
+@app.get("/tasks/changes", response_model=schemas.TaskChanges)
+def read_task_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=schemas.MAX_CHANGES),
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    return crud.get_task_changes(db, user_id=current_user.id, since=since, limit=limit)
+
+@app.get("/events")
+async def stream_events(
+    request: Request,
+    current_user: schemas.User = Depends(get_current_user)
+):
+    # Server-Sent Events: one "data:" line per event, a comment line as
+    # keepalive. A "resync" event means events were dropped.
+    subscription = events.bus.subscribe(current_user.id)
+    return StreamingResponse(
+        events.bus.sse(subscription, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/tasks/export")
+def export_tasks(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    partitions = crud.export_task_partitions(db, user_id=current_user.id, batch_size=export.EXPORT_BATCH_SIZE)
+    gzip = export.accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {"Content-Disposition": f'attachment; filename="tasks.{format}"', "Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export.encode(partitions, format, gzip=gzip),
+        media_type=export.MEDIA_TYPES[format],
+        headers=headers
+    )
+
+@app.post("/tasks/import", response_model=schemas.ImportResult)
+def import_tasks(
+    file: UploadFile = File(...),
+    format: Literal["ndjson", "csv"] | None = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    # the multipart parser has already spooled the upload to a temporary
+    # file, which is read back a line at a time
+    if format is None:
+        format = "csv" if (file.filename or "").lower().endswith(".csv") else "ndjson"
+    return importer.import_tasks(db, user_id=current_user.id, file=file.file, format=format)
+
+if ASYNC_MODE:
+    app.include_router(async_routes.router)
 
 @app.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    # free the writer connection while the password hashes, see auth.authenticate_user
+    db.rollback()
+    db_user = crud.create_user(db=db, user=user)
+    # a new user has no tasks; loading them would need the user's shard
+    return schemas.User(
+        id=db_user.id,
+        username=db_user.username,
+        email=db_user.email,
+        is_active=db_user.is_active
+    )
 
 @app.post("/token")
 def login_for_access_token(
@@ -76,9 +265,17 @@ def login_for_access_token(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/users/me/", response_model=schemas.User)
-def read_users_me(current_user: schemas.User = Depends(get_current_user)):
-    return current_user
+@app.get("/users/me/", response_model=schemas.UserProfile | schemas.User)
+def read_users_me(
+    include_tasks: int = Query(0, ge=0, le=schemas.MAX_PROFILE_TASKS),
+    version: Literal["1", "2"] = "2",
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    if version == "1":
+        # current_user is a cached snapshot without the tasks relationship
+        return schemas.User.model_validate(crud.get_user_with_tasks(db, user_id=current_user.id))
+    return crud.get_user_profile(db, current_user, include_tasks=include_tasks)
 
 @app.post("/tasks/", response_model=schemas.Task)
 def create_task(
@@ -94,25 +291,53 @@ def create_task(
 
 @app.get("/tasks/", response_model=List[schemas.Task])
 def read_tasks(
+    response: Response,
+    request: Request,
     skip: int = 0,
     limit: int = 10,
     completed: bool | None = Query(None),
     category_id: int | None = Query(None),
     search: str | None = Query(None),
+    search_description: bool = True,
     has_reminder: bool | None = Query(None),
+    order_by: Literal["id", "deadline"] = "id",
+    cursor: str | None = Query(None),
+    include: set[str] = Depends(task_includes),
+    fields: list[str] | None = Depends(task_fields),
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
-    return crud.get_tasks(
-        db=db,
-        user_id=current_user.id,
+    try:
+        after = pagination.decode_request_cursor(cursor, order_by, search)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = dict(
         skip=skip,
         limit=limit,
         completed=completed,
         category_id=category_id,
         search=search,
-        has_reminder=has_reminder
+        has_reminder=has_reminder,
+        order_by=order_by,
+        after=after,
+        search_description=search_description
     )
+    etag = etags.collection_etag(request, current_user.id, crud.get_user_version(db, current_user.id))
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
+    if fields is not None:
+        rows = crud.get_task_rows(db, user_id=current_user.id, fields=fields, **filters)
+        next_cursor = pagination.next_cursor(rows, limit, order_by, search)
+        headers = {"ETag": etag}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return Response(projection.dumps(rows, fields), media_type="application/json", headers=headers)
+    tasks = crud.get_tasks(db=db, user_id=current_user.id, include=include, **filters)
+    next_cursor = pagination.next_cursor(tasks, limit, order_by, search)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return tasks
 
 @app.get("/tasks/{task_id}", response_model=schemas.Task)
 def read_task(
@@ -139,6 +364,7 @@ def update_task(
     db_task = crud.update_task(db=db, task_id=task_id, task=task, user_id=current_user.id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found or not authorized")
+    reminders.scheduler.sync_task(db_task)
     return db_task
 
 @app.delete("/tasks/{task_id}", response_model=schemas.Task)
@@ -150,6 +376,7 @@ def delete_task(
     db_task = crud.delete_task(db=db, task_id=task_id, user_id=current_user.id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found or not authorized")
+    reminders.scheduler.cancel(task_id)
     return db_task
 
 @app.post("/categories/", response_model=schemas.Category)
@@ -165,9 +392,15 @@ def create_category(
 
 @app.get("/categories/", response_model=List[schemas.Category])
 def read_categories(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(auth.get_current_user)
 ):
+    etag = etags.collection_etag(request, current_user.id, crud.get_user_version(db, current_user.id))
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
     categories = crud.get_categories(db=db, user_id=current_user.id)
     return categories
 
@@ -188,9 +421,13 @@ def set_reminder(task_id: int, reminder: schemas.ReminderTime, db: Session = Dep
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task.reminder_time = reminder.reminder_time
+    task.reminder_time = reminders.local_time(reminder.reminder_time)
     task.reminder_sent = False
+    task.reminder_lease_owner = None
+    task.reminder_lease_expires = None
     db.commit()
     db.refresh(task)
+    reminders.scheduler.sync_task(task)
+    events.bus.publish(current_user.id, "task.updated", task_ids=[task_id])
     
     return task
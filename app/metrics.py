@@ -0,0 +1,242 @@
+import bisect
+import contextvars
+import threading
+import time
+from sqlalchemy import event
+
+# Minimal Prometheus-style metrics. Updates take one short lock per metric
+# and never allocate per observation beyond the first use of a label set;
+# everything is formatted only when /metrics is scraped.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+# Reads its value(s) at scrape time, for state other modules already track
+# (queue depth, pool usage). fn returns a number or a {labels: number} dict.
+class Callback:
+    def __init__(self, name: str, help: str, fn, type: str = "gauge", labelnames=()):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self._fn = fn
+
+    def samples(self):
+        value = self._fn()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(number)}"
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts (last one is +Inf), then sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, fn, type: str = "gauge", labelnames=()):
+        return self.register(Callback(name, help, fn, type, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status")
+)
+http_latency = registry.histogram(
+    "http_request_duration_seconds", "Time from request start to the end of the response", ("method", "route")
+)
+http_sql_queries = registry.histogram(
+    "http_request_sql_queries", "SQL statements executed per request", ("route",), COUNT_BUCKETS
+)
+http_sql_seconds = registry.histogram(
+    "http_request_sql_seconds", "Time spent in SQL statements per request", ("route",)
+)
+sql_latency = registry.histogram(
+    "db_query_duration_seconds", "Time per SQL statement, for all callers", ("engine",)
+)
+reminder_jobs = registry.counter(
+    "reminder_jobs_total", "check_reminders runs by outcome", ("result",)
+)
+reminder_job_latency = registry.histogram("reminder_job_duration_seconds", "check_reminders run time")
+reminders_claimed = registry.counter("reminders_claimed_total", "Reminders claimed for delivery")
+reminders_sent = registry.counter("reminders_sent_total", "Reminder emails accepted by the SMTP server")
+reminders_failed = registry.counter("reminders_failed_total", "Reminder emails that exhausted their retries")
+scheduler_lag = registry.histogram(
+    "reminder_scheduler_lag_seconds", "How long after its reminder_time a reminder was handed to check_reminders"
+)
+
+
+# Per-request SQL accounting. The middleware puts a fresh [count, seconds]
+# list in this context variable; threadpool calls copy the context, so the
+# engine listeners below add to the same list from any worker thread.
+_request_sql = contextvars.ContextVar("request_sql", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute_listener(engine_name: str):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        sql_latency.observe(elapsed, engine_name)
+        accumulator = _request_sql.get()
+        if accumulator is not None:
+            accumulator[0] += 1
+            accumulator[1] += elapsed
+    return after_cursor_execute
+
+
+def instrument_engine(engine, name: str):
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute_listener(name))
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+# Pure ASGI middleware: no BaseHTTPMiddleware task or body wrapping, just a
+# timer and a look at the response status on the way out.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+        accumulator = [0, 0.0]
+        token = _request_sql.set(accumulator)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_sql.reset(token)
+            route = _route_template(scope)
+            method = scope["method"]
+            http_latency.observe(time.perf_counter() - start, method, route)
+            http_requests.inc(method, route, status)
+            http_sql_queries.observe(accumulator[0], route)
+            http_sql_seconds.observe(accumulator[1], route)
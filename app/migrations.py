@@ -0,0 +1,319 @@
+from sqlalchemy.engine import Connection
+
+# Versioned schema changes for databases created before the current models.
+# The applied version is kept in SQLite's PRAGMA user_version. Each step must
+# be idempotent: on a fresh database create_all() has already built the
+# current schema and every step runs once on top of it.
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str):
+    columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _v1_task_query_indexes(conn: Connection):
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_tasks_id")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_tasks_title")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_tasks_description")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_owner_id_id ON tasks (owner_id, id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_owner_id_deadline_id "
+        "ON tasks (owner_id, deadline, id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_owner_id_completed_id "
+        "ON tasks (owner_id, completed, id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_owner_id_category_id_id "
+        "ON tasks (owner_id, category_id, id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_pending_reminders "
+        "ON tasks (reminder_time) WHERE reminder_sent = 0 AND completed = 0"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_categories_owner_id_name "
+        "ON categories (owner_id, name)"
+    )
+
+
+def _v2_tasks_fts(conn: Connection):
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+        "title, description, content='tasks', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN "
+        "INSERT INTO tasks_fts (rowid, title, description) "
+        "VALUES (new.id, new.title, new.description); "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN "
+        "INSERT INTO tasks_fts (tasks_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_au "
+        "AFTER UPDATE OF title, description ON tasks BEGIN "
+        "INSERT INTO tasks_fts (tasks_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); "
+        "INSERT INTO tasks_fts (rowid, title, description) "
+        "VALUES (new.id, new.title, new.description); "
+        "END"
+    )
+    conn.exec_driver_sql("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+def _v3_reminder_leases(conn: Connection):
+    _add_column(conn, "tasks", "reminder_lease_owner", "VARCHAR")
+    _add_column(conn, "tasks", "reminder_lease_expires", "DATETIME")
+
+
+# Columns that appear in task responses; lease bookkeeping is left out so
+# claiming a reminder does not invalidate clients' cached task lists.
+_VERSIONED_TASK_COLUMNS = "title, description, completed, deadline, category_id, reminder_time, reminder_sent"
+
+
+def _bump_version(owner: str):
+    return (
+        f"INSERT INTO user_versions (user_id, version) VALUES ({owner}.owner_id, 1) "
+        "ON CONFLICT (user_id) DO UPDATE SET version = version + 1; "
+    )
+
+
+def _v4_user_versions(conn: Connection):
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS user_versions ("
+        "user_id INTEGER NOT NULL REFERENCES users (id), "
+        "version INTEGER NOT NULL, PRIMARY KEY (user_id))"
+    )
+    for table, columns in (("tasks", _VERSIONED_TASK_COLUMNS), ("categories", "name")):
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_version_ai AFTER INSERT ON {table} BEGIN "
+            f"{_bump_version('new')}END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_version_ad AFTER DELETE ON {table} BEGIN "
+            f"{_bump_version('old')}END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_version_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+            f"{_bump_version('new')}END"
+        )
+
+
+def _current_version(owner: str):
+    return f"(SELECT version FROM user_versions WHERE user_id = {owner}.owner_id)"
+
+
+# Stamps each task change with the version it bumped to, giving every user a
+# monotonic change sequence with one value per row; deletes leave a tombstone.
+def _v5_task_change_seq(conn: Connection):
+    _add_column(conn, "tasks", "change_seq", "INTEGER")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_owner_id_change_seq ON tasks (owner_id, change_seq)"
+    )
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS task_tombstones ("
+        "task_id INTEGER NOT NULL, owner_id INTEGER NOT NULL REFERENCES users (id), "
+        "change_seq INTEGER NOT NULL, PRIMARY KEY (task_id))"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_task_tombstones_owner_id_change_seq "
+        "ON task_tombstones (owner_id, change_seq)"
+    )
+    for trigger in ("ai", "ad", "au"):
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS tasks_version_{trigger}")
+    conn.exec_driver_sql(
+        "CREATE TRIGGER tasks_version_ai AFTER INSERT ON tasks BEGIN "
+        f"{_bump_version('new')}"
+        f"UPDATE tasks SET change_seq = {_current_version('new')} WHERE id = new.id; "
+        "DELETE FROM task_tombstones WHERE task_id = new.id; "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER tasks_version_ad AFTER DELETE ON tasks BEGIN "
+        f"{_bump_version('old')}"
+        "INSERT OR REPLACE INTO task_tombstones (task_id, owner_id, change_seq) "
+        f"VALUES (old.id, old.owner_id, {_current_version('old')}); "
+        "END"
+    )
+    conn.exec_driver_sql(
+        f"CREATE TRIGGER tasks_version_au AFTER UPDATE OF {_VERSIONED_TASK_COLUMNS} ON tasks BEGIN "
+        f"{_bump_version('new')}"
+        f"UPDATE tasks SET change_seq = {_current_version('new')} WHERE id = new.id; "
+        "END"
+    )
+    # existing tasks count as changed once, so since=0 returns all of them
+    conn.exec_driver_sql(
+        "INSERT INTO user_versions (user_id, version) "
+        "SELECT DISTINCT owner_id, 0 FROM tasks WHERE change_seq IS NULL "
+        "ON CONFLICT (user_id) DO NOTHING"
+    )
+    conn.exec_driver_sql(
+        "UPDATE user_versions SET version = version + 1 "
+        "WHERE user_id IN (SELECT owner_id FROM tasks WHERE change_seq IS NULL)"
+    )
+    conn.exec_driver_sql(
+        "UPDATE tasks SET change_seq = (SELECT version FROM user_versions WHERE user_id = tasks.owner_id) "
+        "WHERE change_seq IS NULL"
+    )
+
+
+def _count_task(row: str, sign: str):
+    category = f"coalesce({row}.category_id, 0)"
+    completed = f"coalesce({row}.completed, 0)"
+    if sign == "+":
+        return (
+            "INSERT INTO task_counters (user_id, category_id, total, completed) "
+            f"VALUES ({row}.owner_id, {category}, 1, {completed}) "
+            "ON CONFLICT (user_id, category_id) DO UPDATE "
+            "SET total = total + 1, completed = completed + excluded.completed; "
+        )
+    return (
+        f"UPDATE task_counters SET total = total - 1, completed = completed - {completed} "
+        f"WHERE user_id = {row}.owner_id AND category_id = {category}; "
+    )
+
+
+def _v6_task_counters(conn: Connection):
+    from .stats import rebuild_counters
+
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS task_counters ("
+        "user_id INTEGER NOT NULL REFERENCES users (id), category_id INTEGER NOT NULL, "
+        "total INTEGER NOT NULL, completed INTEGER NOT NULL, "
+        "PRIMARY KEY (user_id, category_id))"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_open_deadlines "
+        "ON tasks (owner_id, deadline) WHERE completed = 0"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS tasks_counters_ai AFTER INSERT ON tasks BEGIN "
+        f"{_count_task('new', '+')}END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS tasks_counters_ad AFTER DELETE ON tasks BEGIN "
+        f"{_count_task('old', '-')}END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS tasks_counters_au "
+        "AFTER UPDATE OF completed, category_id, owner_id ON tasks BEGIN "
+        f"{_count_task('old', '-')}{_count_task('new', '+')}END"
+    )
+    rebuild_counters(conn)
+
+
+def _v7_sharding(conn: Connection):
+    _add_column(conn, "users", "shard", "INTEGER")
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS id_blocks ("
+        "name VARCHAR NOT NULL, next_id INTEGER NOT NULL, PRIMARY KEY (name))"
+    )
+
+
+# Tombstones are keyed by owner as well: without AUTOINCREMENT SQLite hands a
+# deleted max id to the next insert, which may be another user's task, and
+# that insert must not clear the previous owner's tombstone.
+def _v8_tombstones_per_owner(conn: Connection):
+    conn.exec_driver_sql("DROP TRIGGER IF EXISTS tasks_version_ai")
+    conn.exec_driver_sql("DROP TRIGGER IF EXISTS tasks_version_ad")
+    conn.exec_driver_sql(
+        "CREATE TABLE task_tombstones_new ("
+        "task_id INTEGER NOT NULL, owner_id INTEGER NOT NULL REFERENCES users (id), "
+        "change_seq INTEGER NOT NULL, PRIMARY KEY (task_id, owner_id))"
+    )
+    conn.exec_driver_sql(
+        "INSERT INTO task_tombstones_new (task_id, owner_id, change_seq) "
+        "SELECT task_id, owner_id, change_seq FROM task_tombstones"
+    )
+    conn.exec_driver_sql("DROP TABLE task_tombstones")
+    conn.exec_driver_sql("ALTER TABLE task_tombstones_new RENAME TO task_tombstones")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_task_tombstones_owner_id_change_seq "
+        "ON task_tombstones (owner_id, change_seq)"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER tasks_version_ai AFTER INSERT ON tasks BEGIN "
+        f"{_bump_version('new')}"
+        f"UPDATE tasks SET change_seq = {_current_version('new')} WHERE id = new.id; "
+        "DELETE FROM task_tombstones WHERE task_id = new.id AND owner_id = new.owner_id; "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER tasks_version_ad AFTER DELETE ON tasks BEGIN "
+        f"{_bump_version('old')}"
+        "INSERT OR REPLACE INTO task_tombstones (task_id, owner_id, change_seq) "
+        f"VALUES (old.id, old.owner_id, {_current_version('old')}); "
+        "END"
+    )
+
+
+# Adds the owner to the search index, so a search only walks the caller's
+# postings instead of every tenant's matches; see fts.build_match_query.
+def _v9_tasks_fts_owner(conn: Connection):
+    for trigger in ("ai", "ad", "au"):
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS tasks_fts_{trigger}")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS tasks_fts")
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE tasks_fts USING fts5("
+        "title, description, owner_id, content='tasks', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER tasks_fts_ai AFTER INSERT ON tasks BEGIN "
+        "INSERT INTO tasks_fts (rowid, title, description, owner_id) "
+        "VALUES (new.id, new.title, new.description, new.owner_id); "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER tasks_fts_ad AFTER DELETE ON tasks BEGIN "
+        "INSERT INTO tasks_fts (tasks_fts, rowid, title, description, owner_id) "
+        "VALUES ('delete', old.id, old.title, old.description, old.owner_id); "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER tasks_fts_au "
+        "AFTER UPDATE OF title, description, owner_id ON tasks BEGIN "
+        "INSERT INTO tasks_fts (tasks_fts, rowid, title, description, owner_id) "
+        "VALUES ('delete', old.id, old.title, old.description, old.owner_id); "
+        "INSERT INTO tasks_fts (rowid, title, description, owner_id) "
+        "VALUES (new.id, new.title, new.description, new.owner_id); "
+        "END"
+    )
+    conn.exec_driver_sql("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+MIGRATIONS = [
+    _v1_task_query_indexes,
+    _v2_tasks_fts,
+    _v3_reminder_leases,
+    _v4_user_versions,
+    _v5_task_change_seq,
+    _v6_task_counters,
+    _v7_sharding,
+    _v8_tombstones_per_owner,
+    _v9_tasks_fts_owner,
+]
+
+
+def get_version(conn: Connection) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(engine):
+    with engine.begin() as conn:
+        version = get_version(conn)
+        for target, step in enumerate(MIGRATIONS, start=1):
+            if target <= version:
+                continue
+            step(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {target}")
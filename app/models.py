@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, text
 from sqlalchemy.orm import relationship
 from .database import Base
+from . import sharding
 
 
 class User(Base):
@@ -11,6 +12,8 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
+    # where the user's tasks and categories are stored, see sharding._moving
+    shard = Column(Integer, nullable=True)
 
     tasks = relationship('Task', back_populates='owner')
     categories = relationship('Category', back_populates='owner')
@@ -18,18 +21,22 @@ class User(Base):
 class Category(Base):
     __tablename__ = 'categories'
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, default=sharding.category_ids)
     name = Column(String, nullable=False)
     owner_id = Column(Integer, ForeignKey('users.id'))
     owner = relationship('User', back_populates='categories')
     tasks = relationship('Task', back_populates='category')
 
+    __table_args__ = (
+        Index('ix_categories_owner_id_name', 'owner_id', 'name'),
+    )
+
 class Task(Base):
     __tablename__ = "tasks"
 
-    id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, index=True)
-    description = Column(String, index=True)
+    id = Column(Integer, primary_key=True, default=sharding.task_ids)
+    title = Column(String)
+    description = Column(String)
     completed = Column(Boolean, default=False)
     deadline = Column(DateTime, nullable=True)
     owner_id = Column(Integer, ForeignKey('users.id'))
@@ -37,4 +44,67 @@ class Task(Base):
     category_id = Column(Integer, ForeignKey('categories.id'), nullable=True)
     category = relationship('Category', back_populates='tasks')
     reminder_time = Column(DateTime, nullable=True)  
-    reminder_sent = Column(Boolean, default=False)
\ No newline at end of file
+    reminder_sent = Column(Boolean, default=False)
+    # set while a worker is delivering the reminder, see reminders.claim_reminders
+    reminder_lease_owner = Column(String, nullable=True)
+    reminder_lease_expires = Column(DateTime, nullable=True)
+    # the owner's user_versions.version as of the last change, set by trigger
+    change_seq = Column(Integer, nullable=True)
+
+    # Keep in sync with app/migrations.py, which brings existing databases
+    # to the same set of indexes.
+    __table_args__ = (
+        Index('ix_tasks_owner_id_id', 'owner_id', 'id'),
+        Index('ix_tasks_owner_id_deadline_id', 'owner_id', 'deadline', 'id'),
+        Index('ix_tasks_owner_id_completed_id', 'owner_id', 'completed', 'id'),
+        Index('ix_tasks_owner_id_category_id_id', 'owner_id', 'category_id', 'id'),
+        Index('ix_tasks_owner_id_change_seq', 'owner_id', 'change_seq'),
+        # overdue counts in /tasks/stats
+        Index(
+            'ix_tasks_open_deadlines', 'owner_id', 'deadline',
+            sqlite_where=text('completed = 0')
+        ),
+        # check_reminders only ever looks at unsent reminders of open tasks
+        Index(
+            'ix_tasks_pending_reminders', 'reminder_time',
+            sqlite_where=text('reminder_sent = 0 AND completed = 0')
+        ),
+    )
+# One row per user, bumped by triggers (see migrations._v4_user_versions) in
+# the same transaction as any change to that user's tasks or categories.
+class UserVersion(Base):
+    __tablename__ = "user_versions"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# Left behind by deleted tasks so /tasks/changes can report the deletion.
+class TaskTombstone(Base):
+    __tablename__ = "task_tombstones"
+
+    task_id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    change_seq = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_task_tombstones_owner_id_change_seq', 'owner_id', 'change_seq'),
+    )
+
+# Task totals per user and category (0 for uncategorized), kept current by
+# triggers (see migrations._v6_task_counters); stats.rebuild_counters
+# recomputes them from tasks.
+class TaskCounter(Base):
+    __tablename__ = "task_counters"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+
+# Next unreserved id per table in a sharded deployment, kept in the directory;
+# see sharding.IdAllocator.
+class IdBlock(Base):
+    __tablename__ = "id_blocks"
+
+    name = Column(String, primary_key=True)
+    next_id = Column(Integer, nullable=False)
@@ -0,0 +1,46 @@
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order_by: str, task) -> str:
+    value = getattr(task, order_by)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([order_by, value, task.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order_by: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        if key != order_by or not isinstance(last_id, int):
+            raise InvalidCursor("Cursor does not match the requested ordering")
+        if key == "deadline" and value is not None:
+            value = datetime.fromisoformat(value)
+        elif key == "id":
+            value = last_id
+    except InvalidCursor:
+        raise
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    return value, last_id
+
+
+def decode_request_cursor(cursor: str | None, order_by: str, search: str | None):
+    if cursor is None:
+        return None
+    if search:
+        raise InvalidCursor("Search results are ranked; page them with skip")
+    return decode_cursor(cursor, order_by)
+
+
+def next_cursor(tasks, limit: int, order_by: str, search: str | None) -> str | None:
+    if search or not tasks or len(tasks) < limit:
+        return None
+    return encode_cursor(order_by, tasks[-1])
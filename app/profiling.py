@@ -0,0 +1,162 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import event
+
+# Opt-in slow query log: unset SLOW_QUERY_MS leaves the engines untouched.
+SLOW_QUERY_MS = float(os.environ["SLOW_QUERY_MS"]) if os.getenv("SLOW_QUERY_MS") else None
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "500"))
+# Also append entries to this file, rotated at 10 MB with 5 backups.
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# modules whose frames identify who issued a statement
+CALLER_MODULES = ("app.crud", "app.async_crud", "app.reminders", "app.stats", "app.importer", "app.main")
+_PLANNED = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+_FULL_TASKS_SCAN = re.compile(r"^SCAN tasks\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+logger = logging.getLogger("app.slow_queries")
+
+
+def normalize(statement: str) -> str:
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _PLACEHOLDER_LIST.sub("(?...)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+def parameter_shape(parameters, executemany: bool = False):
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)} x {parameter_shape(rows[0]) if rows else '()'}"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def find_caller() -> str | None:
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module in CALLER_MODULES:
+            name = f"{module}.{frame.f_code.co_name}"
+            if module != "app.main":
+                return name
+            fallback = fallback or name
+        frame = frame.f_back
+    return fallback
+
+
+@dataclass(slots=True)
+class SlowQuery:
+    at: str
+    duration_ms: float
+    statement: str
+    parameters: object
+    caller: str | None
+    plan: list[str] | None = None
+    full_scan: bool = False
+
+
+# Ring buffer of the most recent slow statements. The query plan of each
+# normalized statement is captured once, on the same connection, and reused
+# for later occurrences.
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, maxlen: int = SLOW_QUERY_BUFFER_SIZE, max_plans: int = 1000):
+        self.threshold_ms = threshold_ms
+        self.max_plans = max_plans
+        self._entries = deque(maxlen=maxlen)
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def record(self, conn, statement: str, parameters, executemany: bool, duration: float):
+        normalized = normalize(statement)
+        with self._lock:
+            known = normalized in self._plans
+            plan = self._plans.get(normalized)
+        if not known:
+            plan = self._explain(conn, statement, parameters, executemany)
+            with self._lock:
+                if len(self._plans) < self.max_plans:
+                    self._plans[normalized] = plan
+        entry = SlowQuery(
+            at=datetime.now().isoformat(timespec="milliseconds"),
+            duration_ms=round(duration * 1000, 3),
+            statement=normalized,
+            parameters=parameter_shape(parameters, executemany),
+            caller=find_caller(),
+            plan=plan,
+            full_scan=any(_FULL_TASKS_SCAN.match(step) for step in plan or ())
+        )
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning(
+            "slow query %.1fms%s from %s: %s%s",
+            entry.duration_ms, " [full scan of tasks]" if entry.full_scan else "",
+            entry.caller, entry.statement, f" plan={plan}" if plan else ""
+        )
+        return entry
+
+    def entries(self, limit: int | None = None):
+        with self._lock:
+            entries = list(self._entries)
+        return [asdict(entry) for entry in reversed(entries)][:limit]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._plans.clear()
+
+    def _explain(self, conn, statement: str, parameters, executemany: bool):
+        if not _PLANNED.match(statement):
+            return None
+        if executemany:
+            parameters = next(iter(parameters), ())
+        # raw DBAPI cursor: going through conn would re-enter these listeners
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return [row[3] for row in cursor.fetchall()]
+        except Exception as e:
+            return [f"unavailable: {e}"]
+        finally:
+            cursor.close()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["profile_start"].pop()
+        if duration * 1000 >= self.threshold_ms:
+            self.record(conn, statement, parameters, executemany, duration)
+
+    def instrument(self, engine):
+        if event.contains(engine, "after_cursor_execute", self._after_cursor_execute):
+            return
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+
+slow_queries = SlowQueryLog(SLOW_QUERY_MS) if SLOW_QUERY_MS is not None else None
+
+if slow_queries is not None and SLOW_QUERY_LOG:
+    _handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=10 * 1024 * 1024, backupCount=5)
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(_handler)
+
+
+def instrument_engine(engine):
+    if slow_queries is not None:
+        slow_queries.instrument(engine)
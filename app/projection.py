@@ -0,0 +1,80 @@
+import orjson
+from sqlalchemy import Select
+from . import models
+
+# Sparse-fieldset read path for task listings. Only the requested columns are
+# selected, rows stay plain tuples, and orjson writes the response body, so a
+# page skips both ORM hydration and response_model validation. Keys come out
+# in the same order as schemas.Task.
+TASK_FIELDS = (
+    "title",
+    "description",
+    "completed",
+    "deadline",
+    "category_id",
+    "id",
+    "owner_id",
+    "category",
+    "reminder_time",
+    "reminder_sent",
+)
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(fields: str):
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    if not names:
+        raise InvalidFields("fields must name at least one field")
+    unknown = names - set(TASK_FIELDS)
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in TASK_FIELDS if name in names]
+
+
+def select_fields(statement: Select, fields, order_by: str = "id") -> Select:
+    columns = []
+    for name in fields:
+        if name == "category":
+            # labelled so row.id and row.owner_id still name the task's columns
+            columns += [
+                models.Category.name.label("category_name"),
+                models.Category.id.label("category_id_"),
+                models.Category.owner_id.label("category_owner_id"),
+            ]
+        else:
+            columns.append(getattr(models.Task, name))
+    # keyset pagination reads id and the sort key from the last row
+    for name in dict.fromkeys(("id", order_by)):
+        if name not in fields:
+            columns.append(getattr(models.Task, name))
+    statement = statement.with_only_columns(*columns)
+    if "category" in fields:
+        statement = statement.outerjoin(models.Category, models.Category.id == models.Task.category_id)
+    return statement
+
+
+def _category(name, category_id, owner_id):
+    if category_id is None:
+        return None
+    return {"name": name, "id": category_id, "owner_id": owner_id}
+
+
+def to_dicts(rows, fields):
+    if "category" not in fields:
+        return [dict(zip(fields, row)) for row in rows]
+    split = fields.index("category")
+    before, after = fields[:split], fields[split + 1:]
+    items = []
+    for row in rows:
+        item = dict(zip(before, row))
+        item["category"] = _category(*row[split:split + 3])
+        item.update(zip(after, row[split + 3:]))
+        items.append(item)
+    return items
+
+
+def dumps(rows, fields) -> bytes:
+    return orjson.dumps(to_dicts(rows, fields))
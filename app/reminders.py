@@ -0,0 +1,268 @@
+import heapq
+import os
+import socket
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from . import models
+from .metrics import registry, scheduler_lag
+
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "500"))
+REMINDER_RETRY_DELAY = timedelta(seconds=int(os.getenv("REMINDER_RETRY_SECONDS", "60")))
+# How long a claimed reminder belongs to one worker before others may take it.
+REMINDER_LEASE = timedelta(seconds=int(os.getenv("REMINDER_LEASE_SECONDS", "300")))
+# Full scan for reminders this process has not scheduled itself: set through
+# another worker, or claimed by a worker whose lease has since expired.
+REMINDER_SWEEP_SECONDS = float(os.getenv("REMINDER_SWEEP_SECONDS", "300"))
+
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+ClaimedReminder = namedtuple("ClaimedReminder", "id title deadline owner_id email")
+
+
+# Reminder times are stored and compared as naive local time, like
+# datetime.now(); an offset given by the client is applied here.
+def local_time(when: datetime) -> datetime:
+    if when.tzinfo is None:
+        return when
+    return when.astimezone().replace(tzinfo=None)
+
+
+def _due(now: datetime):
+    return (
+        models.Task.reminder_time <= now,
+        models.Task.reminder_sent == False,
+        models.Task.completed == False
+    )
+
+
+# Atomically take up to limit due, unclaimed (or lease-expired) reminders for
+# owner. A single UPDATE ... RETURNING holds the SQLite write lock for the
+# whole claim, so concurrent workers never get the same row. On a shard the
+# owners' emails come from the directory connection instead of a join.
+def claim_reminders(conn: Connection, owner: str, now: datetime, task_ids=None, limit: int = REMINDER_BATCH_SIZE,
+                    directory: Connection | None = None):
+    candidates = select(models.Task.id).where(
+        *_due(now),
+        or_(models.Task.reminder_lease_expires == None, models.Task.reminder_lease_expires < now)
+    )
+    if task_ids is not None:
+        candidates = candidates.where(models.Task.id.in_(task_ids))
+    claimed = conn.execute(
+        update(models.Task)
+        .where(models.Task.id.in_(candidates.limit(limit).scalar_subquery()))
+        .values(reminder_lease_owner=owner, reminder_lease_expires=now + REMINDER_LEASE)
+        .returning(models.Task.id)
+    ).scalars().all()
+    if not claimed:
+        return []
+    columns = (models.Task.id, models.Task.title, models.Task.deadline, models.Task.owner_id)
+    if directory is None:
+        return conn.execute(
+            select(*columns, models.User.email).join(models.Task.owner).where(models.Task.id.in_(claimed))
+        ).all()
+    tasks = conn.execute(select(*columns).where(models.Task.id.in_(claimed))).all()
+    emails = dict(directory.execute(
+        select(models.User.id, models.User.email).where(models.User.id.in_({task.owner_id for task in tasks}))
+    ).all())
+    return [ClaimedReminder(*task, emails.get(task.owner_id)) for task in tasks]
+
+
+def leased_elsewhere(conn: Connection, owner: str, now: datetime, task_ids):
+    return conn.execute(
+        select(models.Task.id, models.Task.reminder_lease_expires).where(
+            *_due(now),
+            models.Task.id.in_(task_ids),
+            models.Task.reminder_lease_owner != owner,
+            models.Task.reminder_lease_expires >= now
+        )
+    ).all()
+
+
+# Called by the mail worker right before each delivery attempt: a reminder
+# may wait in the mail queue, or back off between retries, for longer than its
+# lease. Extends the lease if owner still holds it; False means another worker
+# may have taken the reminder over (or it was sent or cancelled), so skip it.
+def renew_lease(bind, owner: str, task_id: int, now: datetime | None = None) -> bool:
+    now = datetime.now() if now is None else now
+    with bind.begin() as conn:
+        renewed = conn.execute(
+            update(models.Task)
+            .where(
+                models.Task.id == task_id,
+                models.Task.reminder_lease_owner == owner,
+                models.Task.reminder_lease_expires >= now,
+                models.Task.reminder_sent == False,
+                models.Task.completed == False
+            )
+            .values(reminder_lease_expires=now + REMINDER_LEASE)
+            .returning(models.Task.id)
+        ).first()
+    return renewed is not None
+
+
+def complete_reminder(bind, owner: str, task_id: int):
+    with bind.begin() as conn:
+        conn.execute(
+            update(models.Task)
+            .where(models.Task.id == task_id, models.Task.reminder_lease_owner == owner)
+            .values(reminder_sent=True, reminder_lease_owner=None, reminder_lease_expires=None)
+        )
+
+
+def release_reminder(bind, owner: str, task_id: int):
+    with bind.begin() as conn:
+        conn.execute(
+            update(models.Task)
+            .where(models.Task.id == task_id, models.Task.reminder_lease_owner == owner)
+            .values(reminder_lease_owner=None, reminder_lease_expires=None)
+        )
+
+
+# Min-heap of (reminder_time, task_id) for every pending reminder. A single
+# thread sleeps until the earliest entry is due and hands due task ids to the
+# fire callback in batches. Cancelling or rescheduling only updates
+# _scheduled; stale heap entries are skipped when they reach the top.
+class ReminderScheduler:
+    def __init__(self):
+        self._heap = []
+        self._scheduled = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._fire = None
+        self._stopping = False
+        self._sweep_interval = None
+        self._next_sweep = None
+
+    def load(self, db: Session):
+        rows = db.query(models.Task.id, models.Task.reminder_time).filter(
+            models.Task.reminder_time != None,
+            models.Task.reminder_sent == False,
+            models.Task.completed == False
+        ).execution_options(yield_per=10000)
+        with self._condition:
+            for task_id, reminder_time in rows:
+                self._scheduled[task_id] = reminder_time
+                self._heap.append((reminder_time, task_id))
+            heapq.heapify(self._heap)
+            self._condition.notify()
+
+    def schedule(self, task_id: int, when: datetime):
+        when = local_time(when)
+        with self._condition:
+            if self._scheduled.get(task_id) == when:
+                return
+            self._scheduled[task_id] = when
+            heapq.heappush(self._heap, (when, task_id))
+            if self._heap[0] == (when, task_id):
+                self._condition.notify()
+            self._compact()
+
+    def cancel(self, task_id: int):
+        with self._condition:
+            self._scheduled.pop(task_id, None)
+            self._compact()
+
+    def sync_task(self, task):
+        if task.reminder_time is not None and not task.reminder_sent and not task.completed:
+            self.schedule(task.id, task.reminder_time)
+        else:
+            self.cancel(task.id)
+
+    def next_due(self):
+        with self._condition:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def start(self, fire, sweep_interval: float | None = REMINDER_SWEEP_SECONDS):
+        self._fire = fire
+        self._stopping = False
+        self._sweep_interval = sweep_interval
+        if sweep_interval:
+            self._next_sweep = datetime.now() + timedelta(seconds=sweep_interval)
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                with self._condition:
+                    due = self._wait_for_due()
+            except Exception as e:
+                # a bad entry must not stop every later reminder from firing
+                print(f"Error in reminder scheduler: {e}")
+                with self._condition:
+                    self._condition.wait(1)
+                continue
+            if due is None:
+                return
+            try:
+                # an empty batch means a sweep is due: fire for everything
+                self._fire(due or None)
+            except Exception as e:
+                print(f"Error firing reminders: {e}")
+                if due:
+                    self.retry(due)
+
+    def retry(self, task_ids):
+        retry_at = datetime.now() + REMINDER_RETRY_DELAY
+        for task_id in task_ids:
+            self.schedule(task_id, retry_at)
+
+    def _wait_for_due(self):
+        while not self._stopping:
+            self._drop_stale()
+            if self._next_sweep is not None and self._next_sweep <= datetime.now():
+                self._next_sweep = datetime.now() + timedelta(seconds=self._sweep_interval)
+                return []
+            wake_at = self._heap[0][0] if self._heap else None
+            if self._next_sweep is not None and (wake_at is None or self._next_sweep < wake_at):
+                wake_at = self._next_sweep
+            if wake_at is None:
+                self._condition.wait()
+                continue
+            delay = (wake_at - datetime.now()).total_seconds()
+            if delay > 0 or not self._heap:
+                self._condition.wait(max(delay, 0))
+                continue
+            now = datetime.now()
+            due = []
+            while self._heap and self._heap[0][0] <= now and len(due) < REMINDER_BATCH_SIZE:
+                when, task_id = heapq.heappop(self._heap)
+                if self._scheduled.get(task_id) == when:
+                    del self._scheduled[task_id]
+                    due.append(task_id)
+                    scheduler_lag.observe((now - when).total_seconds())
+            if due:
+                return due
+        return None
+
+    def _drop_stale(self):
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        # keep cancelled entries from outgrowing the live ones
+        if len(self._heap) > 2 * len(self._scheduled) + 1024:
+            self._heap = [(when, task_id) for task_id, when in self._scheduled.items()]
+            heapq.heapify(self._heap)
+
+
+scheduler = ReminderScheduler()
+
+registry.callback("reminder_scheduler_pending", "Reminders waiting in the in-memory heap", lambda: len(scheduler))
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, ConfigDict
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
 from datetime import datetime
 from typing import List
 
@@ -57,5 +57,66 @@ class Task(TaskBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+MAX_PROFILE_TASKS = 100
+
+class TaskCounts(BaseModel):
+    total: int
+    completed: int
+    pending: int
+
+# Version 2 of the /users/me/ response: counts and a link to the paginated
+# task list instead of every task. Version 1 is schemas.User.
+class UserProfile(UserBase):
+    id: int
+    is_active: bool
+    task_counts: TaskCounts
+    tasks_url: str = "/tasks/"
+    tasks: List[Task] | None = None
+
+MAX_CHANGES = 1000
+
+class TaskChanges(BaseModel):
+    changes: List[Task] = []
+    deleted: List[int] = []
+    next_since: int
+    has_more: bool = False
+
+class CategoryStats(BaseModel):
+    category_id: int | None = None
+    name: str | None = None
+    total: int
+    completed: int
+    pending: int
+
+class TaskStats(TaskCounts):
+    overdue: int
+    categories: List[CategoryStats] = []
+
 class ReminderTime(BaseModel):
-    reminder_time: datetime
\ No newline at end of file
+    reminder_time: datetime
+
+MAX_BULK_ITEMS = 1000
+
+class TaskBulkUpdate(TaskUpdate):
+    id: int
+
+class TaskBulkIds(BaseModel):
+    ids: List[int] = Field(max_length=MAX_BULK_ITEMS)
+
+class BulkItemError(BaseModel):
+    index: int
+    id: int | None = None
+    detail: str
+
+class BulkResult(BaseModel):
+    ids: List[int] = []
+    errors: List[BulkItemError] = []
+
+class ImportLineError(BaseModel):
+    line: int
+    detail: str
+
+class ImportResult(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: List[ImportLineError] = []
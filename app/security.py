@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from .metrics import registry
+
+# Shared by auth and crud. Raising BCRYPT_ROUNDS marks existing hashes as
+# needing an update; they are rehashed transparently on the next login.
+pwd_context = CryptContext(
+    schemes=['bcrypt'],
+    deprecated='auto',
+    bcrypt__rounds=int(os.getenv("BCRYPT_ROUNDS", "12"))
+)
+
+# 0 runs bcrypt inline in the calling thread.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Hash/verify calls admitted at once, running or queued for a worker; further
+# callers are shed straight away rather than parking a threadpool thread.
+PASSWORD_HASH_CONCURRENCY = int(os.getenv(
+    "PASSWORD_HASH_CONCURRENCY", str(2 * (PASSWORD_HASH_WORKERS or os.cpu_count() or 1))
+))
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str):
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+# Runs bcrypt in worker processes so a burst of logins burns other cores
+# instead of holding the GIL in the API process.
+class PasswordHasher:
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        concurrency: int = PASSWORD_HASH_CONCURRENCY
+    ):
+        self.workers = workers
+        self.concurrency = concurrency
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password)
+
+    def verify_and_update(self, password: str, hashed_password: str):
+        return self._run(_verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "concurrency": self.concurrency,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _run(self, fn, *args):
+        acquired = self._slots.acquire(blocking=False)
+        with self._lock:
+            if not acquired:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self.running += 1
+        try:
+            if self.workers == 0:
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+
+hasher = PasswordHasher()
+
+registry.callback("password_hasher_running", "Hash/verify calls running or queued for a worker", lambda: hasher.running)
+registry.callback("password_hasher_rejected_total", "Hash/verify calls shed as busy", lambda: hasher.rejected, "counter")
+
+
+def hash_password(password: str) -> str:
+    return hasher.hash(password)
+
+
+def verify_and_update(password: str, hashed_password: str):
+    return hasher.verify_and_update(password, hashed_password)
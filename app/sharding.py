@@ -0,0 +1,369 @@
+import argparse
+import os
+import threading
+import time
+import zlib
+from fastapi import Request
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .database import (
+    SHARDED, SQLALCHEMY_DATABASE_URL, Base, async_engine, engine, make_engine, read_engine,
+    shard_async_engines, shard_engines, shard_read_engines
+)
+
+# Sharded storage, on when SHARD_DATABASE_URLS is set. DATABASE_URL becomes
+# the directory: users, plus the rows of users created before sharding was
+# turned on. New users are placed by hash and their shard is stored, so
+# adding a shard URL later only affects users created after that.
+#
+#   python -m app.sharding status             users and tasks per store
+#   python -m app.sharding spread             move directory users into shards
+#   python -m app.sharding move USER SHARD    rebalance one user
+#
+# To shard an existing todos.db: keep it as DATABASE_URL, set
+# SHARD_DATABASE_URLS, then run spread (with --offline if the app is stopped).
+
+# How long a process trusts its cached user -> shard mapping. A move waits
+# this long (plus a grace period) after marking the user before copying.
+SHARD_MAP_TTL = float(os.getenv("SHARD_MAP_TTL_SECONDS", "1"))
+SHARD_MAP_SIZE = int(os.getenv("SHARD_MAP_SIZE", "100000"))
+# Task and category ids reserved from the directory per round trip.
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", "1000"))
+
+DIRECTORY_TABLES = ("users", "id_blocks")
+
+
+class ShardUnavailable(Exception):
+    pass
+
+
+def hash_shard(user_id: int, count: int | None = None) -> int:
+    return zlib.crc32(str(user_id).encode()) % (count or len(shard_engines))
+
+
+# users.shard: NULL while the user's rows are still in the directory, k for
+# shard k, and during a move -1 (from the directory) or -2 - k (from shard k).
+# Sources below use None for the directory.
+def _moving(source: int | None) -> int:
+    return -1 if source is None else -2 - source
+
+
+def _source(shard: int | None) -> int | None:
+    if shard is None or shard >= 0:
+        return shard
+    return None if shard == -1 else -2 - shard
+
+
+def assign_shard(db: Session, user):
+    if SHARDED and user.shard is None:
+        db.flush()
+        user.shard = hash_shard(user.id)
+
+
+def _max_id(shard_engine, table: str) -> int:
+    # read pool: the caller may be flushing on the shard's only write connection
+    with shard_engine.connect() as conn:
+        return conn.scalar(select(func.coalesce(func.max(Base.metadata.tables[table].c.id), 0)))
+
+
+# Task and category ids must be unique across shards so a user's rows can move
+# between them unchanged. Each process reserves blocks of ids from the
+# directory's id_blocks table and hands them out from memory; the first
+# reservation starts above the highest id already in any shard or the
+# directory. Reservations
+# use their own connection, since they happen mid-flush while the session may
+# be holding the directory's write connection.
+class IdAllocator:
+    def __init__(self, table: str, block_size: int = ID_BLOCK_SIZE):
+        self.table = table
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def __call__(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._reserve()
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve(self) -> int:
+        from .models import IdBlock
+
+        with id_engine.begin() as conn:
+            if conn.scalar(select(IdBlock.next_id).where(IdBlock.name == self.table)) is None:
+                start = 1 + max(_max_id(store, self.table) for store in [read_engine, *shard_read_engines])
+                conn.execute(
+                    insert(IdBlock).values(name=self.table, next_id=start)
+                    .prefix_with("OR IGNORE")
+                )
+            return conn.execute(
+                update(IdBlock).where(IdBlock.name == self.table)
+                .values(next_id=IdBlock.next_id + self.block_size)
+                .returning(IdBlock.next_id)
+            ).scalar() - self.block_size
+
+
+id_engine = make_engine(SQLALCHEMY_DATABASE_URL) if SHARDED else None
+task_ids = IdAllocator("tasks") if SHARDED else None
+category_ids = IdAllocator("categories") if SHARDED else None
+
+
+# users.shard per user id, read from the directory and cached for ttl
+# seconds. Raises ShardUnavailable while the user is being moved; returns
+# None for users still in the directory, and for unknown ones.
+class ShardMap:
+    def __init__(self, ttl: float = SHARD_MAP_TTL, maxsize: int = SHARD_MAP_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}
+
+    def lookup(self, user_id: int) -> int | None:
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] <= now:
+            if len(self._entries) >= self.maxsize:
+                self._entries.clear()
+            entry = self._entries[user_id] = (self._load(user_id), now + self.ttl)
+        shard = entry[0]
+        if shard is not None and shard < 0:
+            raise ShardUnavailable()
+        return shard
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def _load(self, user_id: int) -> int | None:
+        from .models import User
+
+        with read_engine.connect() as conn:
+            row = conn.execute(select(User.shard).where(User.id == user_id)).first()
+        return row.shard if row is not None else None
+
+
+shard_map = ShardMap()
+
+
+def _directory_binds(directory):
+    return {table: directory for name, table in Base.metadata.tables.items() if name in DIRECTORY_TABLES}
+
+
+def _store(user_id: int | None, directory, shards):
+    if user_id is None:
+        return None
+    shard = shard_map.lookup(user_id)
+    return directory if shard is None else shards[shard]
+
+
+# Sessions see users in the directory and everything else in the user's
+# shard, which is the default bind so Core statements and unions route there
+# too. Without a user (sign-up, login) only the directory is bound.
+def session_for(user_id: int | None, read_only: bool = False) -> Session:
+    directory, shards = (read_engine, shard_read_engines) if read_only else (engine, shard_engines)
+    return Session(
+        bind=_store(user_id, directory, shards),
+        binds=_directory_binds(directory),
+        autoflush=False
+    )
+
+
+def async_session_for(user_id: int | None) -> AsyncSession:
+    return AsyncSession(
+        bind=_store(user_id, async_engine, shard_async_engines),
+        binds=_directory_binds(async_engine),
+        autoflush=False,
+        expire_on_commit=False
+    )
+
+
+def _request_subject(request: Request) -> int | None:
+    from .auth import token_subject
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token_subject(token)
+
+
+def request_session(request: Request, read_only: bool) -> Session:
+    return session_for(_request_subject(request), read_only)
+
+
+def request_async_session(request: Request) -> AsyncSession:
+    return async_session_for(_request_subject(request))
+
+
+def _owned_tables():
+    from . import models
+
+    # delete order: tasks first, their triggers write the derived rows below
+    return (
+        (models.Task.__table__, models.Task.owner_id),
+        (models.Category.__table__, models.Category.owner_id),
+        (models.TaskTombstone.__table__, models.TaskTombstone.owner_id),
+        (models.UserVersion.__table__, models.UserVersion.user_id),
+        (models.TaskCounter.__table__, models.TaskCounter.user_id),
+    )
+
+
+def purge_user(conn: Connection, user_id: int):
+    for table, owner in _owned_tables():
+        conn.execute(delete(table).where(owner == user_id))
+
+
+# Copies a user's rows as they are. Inserting tasks fires the target's
+# triggers, so versions, change_seq and counters are put back afterwards.
+def copy_user(source: Connection, target: Connection, user_id: int):
+    from . import models
+
+    rows = {
+        table.name: [dict(row) for row in source.execute(select(table).where(owner == user_id)).mappings()]
+        for table, owner in _owned_tables()
+    }
+    for name in ("categories", "tasks", "task_tombstones"):
+        if rows[name]:
+            target.execute(insert(Base.metadata.tables[name]), rows[name])
+    for name in ("user_versions", "task_counters"):
+        table = Base.metadata.tables[name]
+        target.execute(delete(table).where(table.c.user_id == user_id))
+        if rows[name]:
+            target.execute(insert(table), rows[name])
+    if rows["tasks"]:
+        tasks = models.Task.__table__
+        target.execute(
+            update(tasks).where(tasks.c.id == bindparam("task_id")).values(change_seq=bindparam("seq")),
+            [{"task_id": row["id"], "seq": row["change_seq"]} for row in rows["tasks"]]
+        )
+    return {name: len(rows[name]) for name in ("tasks", "categories")}
+
+
+def _set_shard(user_id: int, shard: int | None):
+    from .models import User
+
+    with engine.begin() as conn:
+        conn.execute(update(User).where(User.id == user_id).values(shard=shard))
+
+
+def _source_engine(source: int | None):
+    return engine if source is None else shard_engines[source]
+
+
+def _source_name(source: int | None) -> str:
+    return "the directory" if source is None else f"shard {source}"
+
+
+RECORDED = object()
+
+
+# Moves a user to another shard: mark them as moving so requests get a 503,
+# wait drain seconds for every process's cached mapping to expire, copy the
+# rows, switch the directory entry, then delete the user's rows everywhere
+# else. source defaults to where users.shard says the rows are; pass it
+# (None for the directory) to repair a user whose entry is wrong. Re-running
+# after a crash resumes from wherever it stopped.
+def move_user(user_id: int, target: int, drain: float = SHARD_MAP_TTL + 5, log=print, source=RECORDED):
+    from .models import User
+
+    if not 0 <= target < len(shard_engines):
+        raise ValueError(f"No shard {target}; there are {len(shard_engines)}")
+    with engine.connect() as conn:
+        row = conn.execute(select(User.shard).where(User.id == user_id)).first()
+    if row is None:
+        raise ValueError(f"No user {user_id}")
+    if source is RECORDED:
+        source = _source(row.shard)
+    if source is not None and not 0 <= source < len(shard_engines):
+        raise ValueError(f"No shard {source}; there are {len(shard_engines)}")
+
+    if source != target:
+        if row.shard is None or row.shard >= 0:
+            _set_shard(user_id, _moving(source))
+            if drain:
+                log(f"User {user_id} marked as moving, waiting {drain:g}s for requests to drain")
+                time.sleep(drain)
+        with _source_engine(source).connect() as src, shard_engines[target].begin() as dst:
+            purge_user(dst, user_id)
+            copied = copy_user(src, dst, user_id)
+        log(f"Copied {copied['tasks']} tasks and {copied['categories']} categories "
+            f"from {_source_name(source)} to shard {target}")
+    _set_shard(user_id, target)
+    shard_map.invalidate(user_id)
+    for store, store_engine in [(None, engine), *enumerate(shard_engines)]:
+        if store != target:
+            with store_engine.begin() as conn:
+                purge_user(conn, user_id)
+    log(f"User {user_id} is on shard {target}")
+
+
+# Moves every user whose rows are still in the directory to their hash shard.
+def spread(drain: float = SHARD_MAP_TTL + 5, log=print):
+    from .models import User
+
+    with engine.connect() as conn:
+        user_ids = conn.execute(
+            select(User.id).where((User.shard == None) | (User.shard == _moving(None))).order_by(User.id)
+        ).scalars().all()
+    for user_id in user_ids:
+        move_user(user_id, hash_shard(user_id), drain, log)
+    return len(user_ids)
+
+
+def shard_status():
+    from .models import Task, User
+
+    users = {}
+    with engine.connect() as conn:
+        for shard in conn.execute(select(User.shard)).scalars():
+            users[_source(shard)] = users.get(_source(shard), 0) + 1
+    status = []
+    for store, store_engine in [(None, engine), *enumerate(shard_engines)]:
+        with store_engine.connect() as conn:
+            status.append((_source_name(store), users.get(store, 0), conn.scalar(select(func.count()).select_from(Task))))
+    return status
+
+
+def _source_arg(value: str) -> int | None:
+    return None if value == "directory" else int(value)
+
+
+def main(argv=None):
+    from .database import init_db
+
+    parser = argparse.ArgumentParser(prog="python -m app.sharding")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("status", help="users and tasks per shard and in the directory")
+    move = subcommands.add_parser("move", help="move a user's tasks and categories to another shard")
+    move.add_argument("user_id", type=int)
+    move.add_argument("shard", type=int)
+    move.add_argument("--from", dest="source", type=_source_arg, default=RECORDED,
+                      help="shard number or 'directory' to copy from, instead of the user's recorded shard")
+    spread_parser = subcommands.add_parser("spread", help="move every user still in the directory into a shard")
+    for subcommand in (move, spread_parser):
+        subcommand.add_argument("--grace", type=float, default=5.0,
+                                help="seconds to wait, beyond SHARD_MAP_TTL_SECONDS, for in-flight requests")
+        subcommand.add_argument("--offline", action="store_true", help="the app is stopped; do not wait")
+    args = parser.parse_args(argv)
+
+    if not SHARDED:
+        parser.error("SHARD_DATABASE_URLS is not set")
+    init_db()
+    if args.command == "status":
+        for store, users, tasks in shard_status():
+            print(f"{store}: {users} users, {tasks} tasks")
+        return
+    drain = 0 if args.offline else SHARD_MAP_TTL + args.grace
+    try:
+        if args.command == "spread":
+            print(f"Moved {spread(drain)} users out of the directory")
+        else:
+            move_user(args.user_id, args.shard, drain, source=args.source)
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    main()
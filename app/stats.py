@@ -0,0 +1,45 @@
+import argparse
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Connection
+from . import models
+
+
+# Recomputes task_counters from the tasks table, for every user or just one.
+# The triggers keep the counters exact; this is for repairing drift after
+# manual edits or restores.
+def rebuild_counters(conn: Connection, user_id: int | None = None):
+    category = func.coalesce(models.Task.category_id, 0)
+    counts = select(
+        models.Task.owner_id,
+        category,
+        func.count(),
+        func.coalesce(func.sum(func.coalesce(models.Task.completed, 0)), 0)
+    ).group_by(models.Task.owner_id, category)
+    clear = delete(models.TaskCounter)
+    if user_id is not None:
+        counts = counts.where(models.Task.owner_id == user_id)
+        clear = clear.where(models.TaskCounter.user_id == user_id)
+    conn.execute(clear)
+    conn.execute(insert(models.TaskCounter).from_select(
+        ["user_id", "category_id", "total", "completed"], counts
+    ))
+
+
+def main(argv=None):
+    from .database import init_db, task_engines
+
+    parser = argparse.ArgumentParser(prog="python -m app.stats")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild = subcommands.add_parser("rebuild", help="recompute task counters from the tasks table")
+    rebuild.add_argument("--user-id", type=int, help="only rebuild this user's counters")
+    args = parser.parse_args(argv)
+
+    init_db()
+    for task_engine in task_engines:
+        with task_engine.begin() as conn:
+            rebuild_counters(conn, args.user_id)
+    print("Task counters rebuilt" + (f" for user {args.user_id}" if args.user_id else ""))
+
+
+if __name__ == "__main__":
+    main()
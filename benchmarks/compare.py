@@ -0,0 +1,52 @@
+import argparse
+import json
+import sys
+
+# Compares two benchmarks.run reports scenario by scenario and exits with 1
+# when any scenario's p95 latency grew, or its throughput fell, by more than
+# --threshold (relative), or its SQL statements per request went up.
+
+
+def compare(baseline: dict, candidate: dict, threshold: float):
+    rows, regressions = [], []
+    for name, new in candidate["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        p95 = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        rps = (new["rps"] - old["rps"]) / old["rps"] if old["rps"] else 0.0
+        sql_up = (
+            old.get("sql_per_request") is not None and new.get("sql_per_request") is not None
+            and new["sql_per_request"] > old["sql_per_request"]
+        )
+        flagged = p95 > threshold or rps < -threshold or sql_up
+        rows.append((name, old["p95_ms"], new["p95_ms"], p95, old["rps"], new["rps"], rps,
+                     old.get("sql_per_request"), new.get("sql_per_request"), flagged))
+        if flagged:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change that counts as a regression")
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    print(f"{'scenario':34} {'p95 ms':>21} {'change':>8} {'req/s':>19} {'change':>8} {'sql/req':>13}")
+    for name, old_p95, new_p95, p95, old_rps, new_rps, rps, old_sql, new_sql, flagged in rows:
+        print(f"{name:34} {old_p95:>9} -> {new_p95:>8} {p95:>+8.0%} {old_rps:>8} -> {new_rps:>7} {rps:>+8.0%} "
+              f"{str(old_sql):>5} -> {str(new_sql):>4}{'  REGRESSION' if flagged else ''}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+
+# Load test for the API. Seeds a fresh SQLite database, then drives every
+# scenario below with --concurrency clients, either in-process through
+# httpx's ASGI transport or against a real uvicorn server, and writes
+# latency percentiles, throughput and SQL statements per request as JSON.
+#
+#   python -m benchmarks.run --users 50 --tasks 2000 --mode uvicorn -o after.json
+#   python -m benchmarks.compare before.json after.json
+
+_SQL_SAMPLE = re.compile(r'^http_request_sql_queries_(sum|count)\{route="((?:[^"\\]|\\.)*)"\} (\S+)$')
+
+
+def percentile(ordered, p: float) -> float:
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies, errors: int, elapsed: float, sql=None) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "sql_per_request": sql,
+    }
+
+
+def parse_sql_metrics(text: str) -> dict:
+    totals = {}
+    for line in text.splitlines():
+        match = _SQL_SAMPLE.match(line)
+        if match:
+            kind, route, value = match.groups()
+            totals.setdefault(route, {"sum": 0.0, "count": 0.0})[kind] = float(value)
+    return totals
+
+
+class Context:
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.users = []
+        self.created = []
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+
+def _auth(user):
+    return {"Authorization": f"Bearer {user['token']}"}
+
+
+def _list(**params):
+    def request(ctx: Context, i: int):
+        user = ctx.user()
+        query = dict(params)
+        if query.get("category_id") == "*":
+            if not user["categories"]:
+                query.pop("category_id")
+            else:
+                query["category_id"] = ctx.rng.choice(user["categories"])
+        if query.get("cursor") == "*":
+            query["cursor"] = user["cursor"]
+            if not query["cursor"]:
+                query.pop("cursor")
+        return "GET", "/tasks/", {"params": query, "headers": _auth(user)}
+    return request
+
+
+def _login(ctx: Context, i: int):
+    from .seed import BENCH_PASSWORD
+    user = ctx.user()
+    return "POST", "/token", {"data": {"username": user["email"], "password": BENCH_PASSWORD}}
+
+
+def _create(ctx: Context, i: int):
+    user = ctx.user()
+    return "POST", "/tasks/", {"json": {"title": f"bench task {i}", "description": "created by the benchmark"},
+                               "headers": _auth(user), "_user": user}
+
+
+def _on_created(ctx: Context, request_kwargs, response):
+    if response.status_code == 200:
+        ctx.created.append((request_kwargs["_user"], response.json()["id"]))
+
+
+def _created(method: str, body=None):
+    def request(ctx: Context, i: int):
+        user, task_id = ctx.created[i % len(ctx.created)]
+        kwargs = {"headers": _auth(user)}
+        if body is not None:
+            kwargs["json"] = body
+        return method, f"/tasks/{task_id}", kwargs
+    return request
+
+
+def _simple(path: str, **params):
+    def request(ctx: Context, i: int):
+        return "GET", path, {"params": params, "headers": _auth(ctx.user())}
+    return request
+
+
+# name -> (route template used by /metrics, request builder, response hook)
+SCENARIOS = {
+    "POST /token": ("/token", _login, None),
+    "GET /tasks/": ("/tasks/", _list(), None),
+    "GET /tasks/?completed=false": ("/tasks/", _list(completed="false"), None),
+    "GET /tasks/?category_id": ("/tasks/", _list(category_id="*"), None),
+    "GET /tasks/?search": ("/tasks/", _list(search="report"), None),
+    "GET /tasks/?has_reminder=true": ("/tasks/", _list(has_reminder="true"), None),
+    "GET /tasks/?order_by=deadline": ("/tasks/", _list(order_by="deadline"), None),
+    "GET /tasks/?cursor": ("/tasks/", _list(cursor="*"), None),
+    "GET /tasks/?limit=100": ("/tasks/", _list(limit=100), None),
+    "GET /tasks/?fields&limit=100": ("/tasks/", _list(limit=100, fields="id,title,completed,deadline"), None),
+    "POST /tasks/": ("/tasks/", _create, _on_created),
+    "GET /tasks/{task_id}": ("/tasks/{task_id}", _created("GET"), None),
+    "PUT /tasks/{task_id}": ("/tasks/{task_id}", _created("PUT", {"completed": True}), None),
+    "DELETE /tasks/{task_id}": ("/tasks/{task_id}", _created("DELETE"), None),
+    "GET /categories/": ("/categories/", _simple("/categories/"), None),
+    "GET /users/me/": ("/users/me/", _simple("/users/me/"), None),
+    "GET /tasks/stats": ("/tasks/stats", _simple("/tasks/stats"), None),
+    "GET /tasks/changes": ("/tasks/changes", _simple("/tasks/changes", since=0), None),
+}
+
+
+async def drive(client, ctx: Context, build, hook, requests: int, concurrency: int):
+    indexes = iter(range(requests))
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for i in indexes:
+            method, url, kwargs = build(ctx, i)
+            send_kwargs = {k: v for k, v in kwargs.items() if not k.startswith("_")}
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **send_kwargs)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+            if hook is not None:
+                hook(ctx, kwargs, response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def prepare_users(client, ctx: Context, count: int):
+    from .seed import BENCH_PASSWORD, user_email
+    for index in range(count):
+        email = user_email(index)
+        response = await client.post("/token", data={"username": email, "password": BENCH_PASSWORD})
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        categories = [c["id"] for c in (await client.get("/categories/", headers=headers)).json()]
+        first_page = await client.get("/tasks/", headers=headers)
+        ctx.users.append({
+            "email": email,
+            "token": token,
+            "categories": categories,
+            "cursor": first_page.headers.get("X-Next-Cursor"),
+        })
+
+
+async def run_scenarios(client, args, selected) -> dict:
+    ctx = Context(random.Random(args.seed))
+    await prepare_users(client, ctx, min(args.users, args.clients))
+    results = {}
+    for name in selected:
+        route, build, hook = SCENARIOS[name]
+        if route == "/tasks/{task_id}" and not ctx.created:
+            continue
+        requests = args.login_requests if name == "POST /token" else args.requests
+        before = parse_sql_metrics((await client.get("/metrics")).text).get(route, {"sum": 0.0, "count": 0.0})
+        latencies, errors, elapsed = await drive(client, ctx, build, hook, requests, args.concurrency)
+        after = parse_sql_metrics((await client.get("/metrics")).text).get(route, {"sum": 0.0, "count": 0.0})
+        count = after["count"] - before["count"]
+        sql = round((after["sum"] - before["sum"]) / count, 2) if count else None
+        results[name] = summarize(latencies, errors, elapsed, sql)
+        print(f"{name:34} {results[name]['rps']:>9} req/s  p50 {results[name]['p50_ms']:>8} ms  "
+              f"p95 {results[name]['p95_ms']:>8} ms  p99 {results[name]['p99_ms']:>8} ms  sql {sql}", file=sys.stderr)
+    return results
+
+
+class _NullSMTP:
+    def send_message(self, message):
+        pass
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def run_check_reminders(count: int) -> dict:
+    from app import email_utils, main, metrics
+    from app.database import shard_engines, task_engines
+    from .seed import make_reminders_due
+
+    stores = shard_engines or task_engines
+    due = [task_id for store in stores for task_id in make_reminders_due(store, count // len(stores))]
+    original = email_utils.mail_queue
+    # no workers: delivery happens inline, against an SMTP stand-in
+    email_utils.mail_queue = email_utils.MailQueue(email_utils.SMTPConnectionPool(size=1, connect=_NullSMTP), workers=0)
+    statements = metrics.sql_latency.count("write")
+    try:
+        start = time.perf_counter()
+        main.check_reminders()
+        elapsed = time.perf_counter() - start
+    finally:
+        email_utils.mail_queue = original
+    result = summarize([elapsed], 0, elapsed)
+    result["reminders"] = len(due)
+    result["reminders_per_second"] = round(len(due) / elapsed, 1) if elapsed else 0.0
+    result["sql_statements"] = metrics.sql_latency.count("write") - statements
+    print(f"{'check_reminders':34} {len(due)} reminders in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    return result
+
+
+@asynccontextmanager
+async def inprocess_client():
+    import httpx
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            yield client
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def uvicorn_client(workers: int):
+    import httpx
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=os.environ.copy()
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=httpx.Limits(max_connections=1000)) as client:
+            for _ in range(200):
+                try:
+                    if (await client.get("/metrics")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited during startup")
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start")
+            yield client
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=1000, help="tasks per user")
+    parser.add_argument("--categories", type=int, default=5, help="categories per user")
+    parser.add_argument("--reminder-ratio", type=float, default=0.1)
+    parser.add_argument("--due-reminders", type=int, default=500, help="reminders made due for the check_reminders run")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--uvicorn-workers", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=50, help="requests for POST /token (bcrypt bound)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=10, help="distinct users the clients log in as")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only these scenarios")
+    parser.add_argument("--db", help="database file; a fresh temporary one by default")
+    parser.add_argument("--shards", type=int, default=0, help="store tasks in this many shard files next to --db")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_path = Path(args.db or Path(tempfile.mkdtemp(prefix="todo-bench-")) / "bench.db")
+    shard_paths = [db_path.with_name(f"{db_path.stem}-shard{i}{db_path.suffix}") for i in range(args.shards)]
+    for path in [db_path, *shard_paths]:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+    # app.database reads these at import time, and uvicorn inherits them
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    if shard_paths:
+        os.environ["SHARD_DATABASE_URLS"] = ",".join(f"sqlite:///{path}" for path in shard_paths)
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("REMINDER_SWEEP_SECONDS", "0")
+
+    from app.database import engine, init_db, shard_engines
+    from .seed import seed
+
+    init_db()
+    start = time.perf_counter()
+    seed(engine, args.users, args.tasks, args.categories, args.reminder_ratio, args.seed, shards=shard_engines)
+    seed_seconds = time.perf_counter() - start
+    print(f"seeded {args.users * args.tasks} tasks in {seed_seconds:.1f}s", file=sys.stderr)
+
+    selected = args.scenario or list(SCENARIOS)
+    client_factory = inprocess_client() if args.mode == "inprocess" else uvicorn_client(args.uvicorn_workers)
+
+    async def run():
+        async with client_factory as client:
+            return await run_scenarios(client, args, selected)
+
+    results = asyncio.run(run())
+    if args.due_reminders:
+        results["check_reminders"] = run_check_reminders(args.due_reminders)
+
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "mode": args.mode,
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "db")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version,
+            "cpus": os.cpu_count(),
+        },
+        "seed_seconds": round(seed_seconds, 2),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
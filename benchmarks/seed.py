@@ -0,0 +1,104 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, insert, select, update
+
+BENCH_PASSWORD = "bench-password"
+WORDS = (
+    "report budget review call email invoice design deploy release meeting plan "
+    "draft update fix test write read clean order book pay renew check backup"
+).split()
+
+
+def user_email(index: int) -> str:
+    return f"user{index}@bench.example.com"
+
+
+def _title(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))
+
+
+# Fills an empty database with users x tasks x categories through executemany
+# inserts, chunk_size rows per statement. A reminder_ratio share of tasks get
+# a reminder in the future, so the scheduler stays idle while endpoints are
+# measured. Every user's password is BENCH_PASSWORD, hashed once. With
+# shards, users go into engine and each user's rows into their hash shard.
+def seed(engine, users: int, tasks_per_user: int, categories_per_user: int,
+         reminder_ratio: float = 0.1, seed: int = 0, chunk_size: int = 10000, shards=None):
+    from app import models
+    from app.security import pwd_context
+    from app.sharding import hash_shard
+
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    hashed = pwd_context.hash(BENCH_PASSWORD)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            dict(username=f"user{i}", email=user_email(i), hashed_password=hashed, is_active=True)
+            for i in range(users)
+        ])
+        user_ids = conn.execute(select(models.User.id).order_by(models.User.id)).scalars().all()
+
+    placement = {}
+    for user_id in user_ids:
+        placement.setdefault(shards[hash_shard(user_id, len(shards))] if shards else engine, []).append(user_id)
+    if shards:
+        users = models.User.__table__
+        with engine.begin() as conn:
+            conn.execute(
+                update(users).where(users.c.id == bindparam("user_id")).values(shard=bindparam("placed")),
+                [{"user_id": user_id, "placed": hash_shard(user_id, len(shards))} for user_id in user_ids]
+            )
+
+    for target, owners in placement.items():
+        with target.begin() as conn:
+            if categories_per_user:
+                conn.execute(insert(models.Category), [
+                    dict(name=f"Category {c}", owner_id=user_id)
+                    for user_id in owners for c in range(categories_per_user)
+                ])
+            categories = {}
+            for category_id, owner_id in conn.execute(select(models.Category.id, models.Category.owner_id)):
+                categories.setdefault(owner_id, []).append(category_id)
+
+        def task_rows():
+            for user_id in owners:
+                owned = categories.get(user_id, [])
+                for _ in range(tasks_per_user):
+                    has_reminder = rng.random() < reminder_ratio
+                    yield dict(
+                        title=_title(rng),
+                        description=_title(rng) if rng.random() < 0.5 else None,
+                        completed=rng.random() < 0.3,
+                        deadline=now + timedelta(days=rng.randint(-30, 60)) if rng.random() < 0.7 else None,
+                        owner_id=user_id,
+                        category_id=rng.choice(owned) if owned and rng.random() < 0.8 else None,
+                        reminder_time=now + timedelta(days=rng.randint(1, 30)) if has_reminder else None,
+                        reminder_sent=False
+                    )
+
+        chunk = []
+        for row in task_rows():
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                with target.begin() as conn:
+                    conn.execute(insert(models.Task), chunk)
+                chunk = []
+        if chunk:
+            with target.begin() as conn:
+                conn.execute(insert(models.Task), chunk)
+    return user_ids
+
+
+def make_reminders_due(engine, count: int):
+    from app import models
+
+    past = datetime.now() - timedelta(minutes=1)
+    with engine.begin() as conn:
+        ids = conn.execute(
+            select(models.Task.id).where(models.Task.completed == False).limit(count)
+        ).scalars().all()
+        conn.execute(
+            update(models.Task).where(models.Task.id.in_(ids))
+            .values(reminder_time=past, reminder_sent=False, reminder_lease_owner=None, reminder_lease_expires=None)
+        )
+    return ids
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Per-row cost of the two /tasks/ read paths on one large page: ORM hydration
+# plus response_model validation and JSON encoding, against the ?fields=
+# projection (column tuples written with orjson).
+#
+#   python -m benchmarks.serialization --tasks 5000
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization")
+    parser.add_argument("--tasks", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    db_path = Path(tempfile.mkdtemp(prefix="todo-bench-")) / "serialization.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from app import crud, projection, schemas
+    from app.database import SessionLocal, engine, init_db
+    from .seed import seed
+
+    init_db()
+    [user_id] = seed(engine, 1, args.tasks, args.categories)
+    adapter = TypeAdapter(list[schemas.Task])
+    fields = list(projection.TASK_FIELDS)
+
+    def orm():
+        with SessionLocal() as db:
+            tasks = crud.get_tasks(db, user_id, limit=args.tasks)
+            json.dumps(jsonable_encoder(adapter.validate_python(tasks, from_attributes=True)))
+
+    def rows():
+        with SessionLocal() as db:
+            projection.dumps(crud.get_task_rows(db, user_id, fields, limit=args.tasks), fields)
+
+    results = {}
+    for name, fn in (("orm", orm), ("projection", rows)):
+        fn()
+        elapsed = best_of(args.repeat, fn)
+        results[name] = {"page_ms": round(elapsed * 1000, 2), "us_per_row": round(elapsed / args.tasks * 1e6, 2)}
+        print(f"{name:12} {results[name]['page_ms']:>9} ms/page {results[name]['us_per_row']:>8} us/row", file=sys.stderr)
+    print(json.dumps({"tasks": args.tasks, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import pytest
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
-from app.database import Base, get_db
+from app.database import Base, get_db, init_db
 from app.main import app
+from app.auth_cache import token_cache
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
@@ -22,6 +24,20 @@ client = TestClient(app)
 
 @pytest.fixture(scope="function")
 def setup_db():
-    Base.metadata.create_all(bind=engine)
+    init_db(bind=engine)
+    token_cache.clear()
     yield
-    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+@contextmanager
+def count_queries(bind=engine):
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(bind, "before_cursor_execute", before_cursor_execute)
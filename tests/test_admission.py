@@ -0,0 +1,85 @@
+import asyncio
+from setup_tests import client, setup_db
+from app import admission
+from app.admission import ConcurrencyLimiter, RateLimiter
+
+def login():
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_token_bucket_refills():
+    limiter = RateLimiter(rate=2, burst=2)
+    assert limiter.take(1, now=0) == 0
+    assert limiter.take(1, now=0) == 0
+    assert limiter.take(1, now=0) == 0.5
+    assert limiter.take(2, now=0) == 0
+    assert limiter.take(1, now=0.5) == 0
+
+def test_token_buckets_pruned_when_full():
+    limiter = RateLimiter(rate=1, burst=1, max_users=2)
+    limiter.take(1, now=0)
+    limiter.take(2, now=10)
+    limiter.take(3, now=10)
+    assert len(limiter) == 2
+    assert limiter.take(2, now=10) > 0
+
+def test_concurrency_limiter_queues_and_sheds():
+    async def scenario():
+        limiter = ConcurrencyLimiter(limit=1, max_queue=1, timeout=1)
+        assert await limiter.acquire() is None
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+        assert await limiter.acquire() == "queue_full"
+        limiter.release()
+        assert await waiting is None
+        assert limiter.active == 1
+
+        limiter.timeout = 0.01
+        assert await limiter.acquire() == "timeout"
+        assert limiter.queued == 0
+        limiter.release()
+        assert limiter.active == 0
+    asyncio.run(scenario())
+
+def test_per_user_rate_limit(setup_db, monkeypatch):
+    headers = login()
+    monkeypatch.setattr(admission.controller, "reads", RateLimiter(rate=0.001, burst=2))
+    monkeypatch.setattr(admission.controller, "writes", RateLimiter(rate=0.001, burst=1))
+    assert client.get("/tasks/", headers=headers).status_code == 200
+    assert client.get("/tasks/", headers=headers).status_code == 200
+    response = client.get("/tasks/", headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+    # reads and writes have separate buckets
+    assert client.post("/tasks/", json={"title": "Task"}, headers=headers).status_code == 200
+    assert client.post("/tasks/", json={"title": "Task"}, headers=headers).status_code == 429
+    # /token is exempt, and a different token for the same user shares the bucket
+    headers = login()
+    assert client.get("/tasks/", headers=headers).status_code == 429
+
+def test_global_cap_sheds_with_503(setup_db, monkeypatch):
+    monkeypatch.setattr(admission.controller, "concurrency", ConcurrencyLimiter(limit=0, max_queue=0))
+    response = client.post("/token", data={"username": "test@example.com", "password": "x"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/metrics").status_code == 200
+
+def test_transfers_have_their_own_cap(setup_db, monkeypatch):
+    headers = login()
+    monkeypatch.setattr(admission.controller, "concurrency", ConcurrencyLimiter(limit=0, max_queue=0))
+    assert client.get("/tasks/", headers=headers).status_code == 503
+    assert client.get("/tasks/export", headers=headers).status_code == 200
+
+    monkeypatch.setattr(admission.controller, "transfers", ConcurrencyLimiter(limit=0, max_queue=0))
+    assert client.get("/tasks/export", headers=headers).status_code == 503
+    assert client.post("/tasks/import", files={"file": ("tasks.csv", b"title\n")}, headers=headers).status_code == 503
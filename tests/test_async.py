@@ -0,0 +1,90 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from datetime import datetime, timezone
+from setup_tests import client, setup_db
+from app import reminders
+from app.async_routes import router
+from app.database import get_async_db
+
+# NullPool: TestClient may run each request on a fresh event loop
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+async_app = FastAPI()
+async_app.include_router(router)
+async_app.dependency_overrides[get_async_db] = override_get_async_db
+async_client = TestClient(async_app)
+
+def test_async_task_lifecycle(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    token = response.json()["access_token"]
+    category_response = async_client.post("/categories/", json={
+        "name": "Work"
+    }, headers={"Authorization": f"Bearer {token}"})
+    category_id = category_response.json()["id"]
+    response = async_client.post("/tasks/", json={
+        "title": "Async Task",
+        "category_id": category_id
+    }, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["category"]["name"] == "Work"
+    task_id = response.json()["id"]
+
+    response = async_client.put(f"/tasks/{task_id}", json={
+        "completed": True
+    }, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["completed"] is True
+
+    response = async_client.get("/tasks/", params={"completed": True}, headers={"Authorization": f"Bearer {token}"})
+    assert [task["id"] for task in response.json()] == [task_id]
+
+    response = async_client.get("/users/me/", params={"include_tasks": 1}, headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["task_counts"] == {"total": 1, "completed": 1, "pending": 0}
+    assert response.json()["tasks"][0]["category"]["name"] == "Work"
+
+    response = async_client.delete(f"/tasks/{task_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    response = async_client.get(f"/tasks/{task_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
+
+def test_async_rejects_invalid_token(setup_db):
+    response = async_client.get("/tasks/", headers={"Authorization": "Bearer invalid"})
+    assert response.status_code == 401
+
+def test_async_set_reminder_accepts_offsets(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    ids = [async_client.post("/tasks/", json={"title": f"Task {i}"}, headers=headers).json()["id"] for i in range(2)]
+    try:
+        response = async_client.put(f"/tasks/{ids[0]}/set_reminder", json={"reminder_time": "2030-01-01T12:00:00"}, headers=headers)
+        assert response.status_code == 200
+        response = async_client.put(f"/tasks/{ids[1]}/set_reminder", json={"reminder_time": "2030-01-01T00:00:00+02:00"}, headers=headers)
+        assert response.status_code == 200
+        local = datetime(2029, 12, 31, 22, 0, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        assert response.json()["reminder_time"] == local.isoformat()
+    finally:
+        for task_id in ids:
+            reminders.scheduler.cancel(task_id)
@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from starlette.requests import Request
+from app.database import make_engine, get_db, engine, read_engine
+
+def test_make_engine_applies_pragmas(tmp_path):
+    url = f"sqlite:///{tmp_path / 'pragmas.db'}"
+    writer = make_engine(url)
+    reader = make_engine(url, read_only=True, pool_size=4)
+    with writer.begin() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+        conn.exec_driver_sql("CREATE TABLE t (x INTEGER)")
+    assert writer.pool.size() == 1
+    assert reader.pool.size() == 4
+    with reader.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM t").scalar() == 0
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql("INSERT INTO t VALUES (1)")
+
+def test_get_db_routes_by_method():
+    for method, expected in (("GET", read_engine), ("POST", engine), ("DELETE", engine)):
+        request = Request({"type": "http", "method": method, "headers": []})
+        session_gen = get_db(request)
+        db = next(session_gen)
+        assert db.get_bind() is expected
+        session_gen.close()
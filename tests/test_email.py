@@ -0,0 +1,109 @@
+import socket
+import threading
+import pytest
+from app.email_utils import MailQueue, OutgoingEmail, SMTPConnectionPool
+
+class FlakySMTP:
+    connections = 0
+
+    def __init__(self):
+        FlakySMTP.connections += 1
+        self.calls = 0
+
+    def send_message(self, message):
+        self.calls += 1
+        if message["To"] == "flaky@example.com" and self.calls == 1:
+            raise ConnectionError("temporary failure")
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_mail_queue_reuses_connections_and_retries():
+    FlakySMTP.connections = 0
+    mail_queue = MailQueue(SMTPConnectionPool(size=2, connect=FlakySMTP), workers=2, backoff=0.01)
+    mail_queue.start()
+    delivered = []
+    lock = threading.Lock()
+    def on_sent(index):
+        with lock:
+            delivered.append(index)
+    for i in range(50):
+        mail_queue.submit(OutgoingEmail(
+            to_email="flaky@example.com" if i == 0 else f"user{i}@example.com",
+            subject="Reminder",
+            content="content",
+            on_sent=lambda i=i: on_sent(i)
+        ))
+    mail_queue.stop()
+    assert sorted(delivered) == list(range(50))
+    stats = mail_queue.stats()
+    assert stats["sent"] == 50
+    assert stats["retried"] == 1
+    assert stats["failed"] == 0
+    # one broken connection replaced, the rest reused
+    assert FlakySMTP.connections <= 3
+
+def test_mail_queue_drops_messages_no_longer_wanted():
+    class BrokenSMTP(FlakySMTP):
+        def send_message(self, message):
+            raise ConnectionError("down")
+    checks = []
+    def before_send():
+        # still wanted for the first attempt only, e.g. the lease ran out while backing off
+        checks.append(1)
+        return len(checks) == 1
+    outcomes = []
+    mail_queue = MailQueue(SMTPConnectionPool(size=1, connect=BrokenSMTP), workers=0, max_attempts=3, backoff=0)
+    mail_queue.submit(OutgoingEmail(
+        "user@example.com", "Reminder", "content",
+        on_sent=lambda: outcomes.append("sent"), on_failed=lambda: outcomes.append("failed"), before_send=before_send
+    ))
+    assert len(checks) == 2
+    assert outcomes == []
+    assert mail_queue.stats()["skipped"] == 1
+
+def test_mail_queue_reports_permanent_failure():
+    class BrokenSMTP(FlakySMTP):
+        def send_message(self, message):
+            raise ConnectionError("down")
+    failures = []
+    mail_queue = MailQueue(SMTPConnectionPool(size=1, connect=BrokenSMTP), workers=0, max_attempts=2, backoff=0)
+    mail_queue.submit(OutgoingEmail("user@example.com", "Reminder", "content", on_failed=lambda: failures.append(1)))
+    assert failures == [1]
+    assert mail_queue.stats()["failed"] == 1
+
+def test_mail_queue_against_local_smtp_server(monkeypatch):
+    controller_module = pytest.importorskip("aiosmtpd.controller")
+    from aiosmtpd.handlers import Sink
+
+    received = []
+    class Handler(Sink):
+        async def handle_DATA(self, server, session, envelope):
+            received.append(envelope.rcpt_tos)
+            return "250 OK"
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    controller = controller_module.Controller(Handler(), hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        monkeypatch.setenv("EMAIL_HOST", "127.0.0.1")
+        monkeypatch.setenv("EMAIL_PORT", str(port))
+        monkeypatch.setenv("EMAIL_USER", "")
+        monkeypatch.setenv("EMAIL_FROM", "todo@example.com")
+        monkeypatch.setenv("EMAIL_STARTTLS", "0")
+        mail_queue = MailQueue(SMTPConnectionPool(size=2), workers=2)
+        mail_queue.start()
+        for i in range(20):
+            mail_queue.submit(OutgoingEmail(f"user{i}@example.com", "Reminder", "content"))
+        mail_queue.stop()
+    finally:
+        controller.stop()
+    assert len(received) == 20
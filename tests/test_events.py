@@ -0,0 +1,110 @@
+import asyncio
+import json
+import threading
+from setup_tests import client, setup_db
+from app.events import EventBus, bus
+
+def test_event_bus_fans_out_per_user():
+    async def run():
+        events = EventBus(buffer_size=10)
+        alice = events.subscribe(1)
+        alice_too = events.subscribe(1)
+        bob = events.subscribe(2)
+        thread = threading.Thread(target=events.publish, args=(1, "task.created"), kwargs={"task_ids": [7]})
+        thread.start()
+        thread.join()
+        assert [json.loads(e) for e in await alice.get(timeout=1)] == [{"type": "task.created", "task_ids": [7]}]
+        assert len(await alice_too.get(timeout=1)) == 1
+        assert await bob.get(timeout=0.01) == []
+        events.unsubscribe(alice)
+        events.unsubscribe(alice_too)
+        events.unsubscribe(bob)
+        assert events.stats()["subscribers"] == 0
+    asyncio.run(run())
+
+def test_slow_subscriber_gets_resync():
+    async def run():
+        events = EventBus(buffer_size=3)
+        subscription = events.subscribe(1)
+        for i in range(5):
+            events.publish(1, "task.updated", task_ids=[i])
+        await asyncio.sleep(0)
+        assert [json.loads(e) for e in await subscription.get(timeout=1)] == [{"type": "resync"}]
+        events.publish(1, "task.deleted", task_ids=[9])
+        assert json.loads((await subscription.get(timeout=1))[0])["type"] == "task.deleted"
+    asyncio.run(run())
+
+def test_sse_stream_format():
+    async def run():
+        events = EventBus()
+        subscription = events.subscribe(1)
+        disconnected = False
+        async def is_disconnected():
+            return disconnected
+        stream = events.sse(subscription, is_disconnected, heartbeat=0.01)
+        assert await anext(stream) == b": connected\n\n"
+        assert await anext(stream) == b": keepalive\n\n"
+        events.publish(1, "task.created", task_ids=[1])
+        assert await anext(stream) == b'data: {"type":"task.created","task_ids":[1]}\n\n'
+        disconnected = True
+        await stream.aclose()
+        assert events.stats()["subscribers"] == 0
+    asyncio.run(run())
+
+def test_writes_publish_events(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    user_id = client.get("/users/me/", headers=headers).json()["id"]
+
+    async def run():
+        subscription = bus.subscribe(user_id)
+        try:
+            task_id = (await asyncio.to_thread(client.post, "/tasks/", json={"title": "Task"}, headers=headers)).json()["id"]
+            await asyncio.to_thread(client.put, f"/tasks/{task_id}", json={"completed": True}, headers=headers)
+            await asyncio.to_thread(client.delete, f"/tasks/{task_id}", headers=headers)
+            received = []
+            while len(received) < 3:
+                received += [json.loads(e) for e in await subscription.get(timeout=1)]
+            return task_id, received
+        finally:
+            bus.unsubscribe(subscription)
+    task_id, received = asyncio.run(run())
+    assert received == [
+        {"type": "task.created", "task_ids": [task_id]},
+        {"type": "task.updated", "task_ids": [task_id]},
+        {"type": "task.deleted", "task_ids": [task_id]},
+    ]
+
+def test_deleting_a_category_publishes_detached_tasks(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    user_id = client.get("/users/me/", headers=headers).json()["id"]
+    category_id = client.post("/categories/", json={"name": "Work"}, headers=headers).json()["id"]
+    task_ids = [client.post("/tasks/", json={"title": f"Task {i}", "category_id": category_id}, headers=headers).json()["id"]
+                for i in range(2)]
+    client.post("/tasks/", json={"title": "Loose"}, headers=headers)
+
+    async def run():
+        subscription = bus.subscribe(user_id)
+        try:
+            await asyncio.to_thread(client.delete, f"/categories/{category_id}", headers=headers)
+            return [json.loads(e) for e in await subscription.get(timeout=1)]
+        finally:
+            bus.unsubscribe(subscription)
+    assert asyncio.run(run()) == [{"type": "task.updated", "task_ids": task_ids}]
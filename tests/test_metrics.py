@@ -0,0 +1,45 @@
+from setup_tests import client, engine, setup_db
+from app import metrics
+from app.metrics import Registry
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.1, "/a")
+    histogram.observe(3, "/a")
+    registry.counter("hits_total", "Hits", ("route",)).inc('/"b"')
+    text = registry.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/a"} 3' in text
+    assert 'hits_total{route="/\\"b\\""} 1' in text
+    assert "# TYPE latency_seconds histogram" in text
+
+def test_metrics_endpoint(setup_db):
+    metrics.instrument_engine(engine, "test")
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    task_id = client.post("/tasks/", json={"title": "Task"}, headers=headers).json()["id"]
+
+    before = metrics.http_sql_queries.count("/tasks/{task_id}")
+    requests = metrics.http_requests.value("GET", "/tasks/{task_id}", 200)
+    client.get(f"/tasks/{task_id}", headers=headers)
+    assert metrics.http_requests.value("GET", "/tasks/{task_id}", 200) == requests + 1
+    assert metrics.http_sql_queries.count("/tasks/{task_id}") == before + 1
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/tasks/{task_id}",le="+Inf"}' in response.text
+    assert 'db_query_duration_seconds_count{engine="test"}' in response.text
+    assert "# TYPE email_sent_total counter" in response.text
+    assert "reminder_scheduler_pending " in response.text
@@ -0,0 +1,46 @@
+from sqlalchemy import create_engine, inspect
+from app.database import init_db
+from app.migrations import MIGRATIONS, get_version
+
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL, "
+    "email VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL, is_active BOOLEAN)",
+    "CREATE TABLE categories (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+    "owner_id INTEGER REFERENCES users (id))",
+    "CREATE TABLE tasks (id INTEGER PRIMARY KEY, title VARCHAR, description VARCHAR, "
+    "completed BOOLEAN, deadline DATETIME, owner_id INTEGER REFERENCES users (id), "
+    "category_id INTEGER REFERENCES categories (id), reminder_time DATETIME, "
+    "reminder_sent BOOLEAN)",
+    "CREATE INDEX ix_tasks_id ON tasks (id)",
+    "CREATE INDEX ix_tasks_title ON tasks (title)",
+    "CREATE INDEX ix_tasks_description ON tasks (description)",
+]
+
+def test_migrate_legacy_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(
+            "INSERT INTO tasks (title, completed, owner_id, reminder_sent) VALUES ('Kept', 0, 1, 0)"
+        )
+
+    init_db(bind=engine)
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("tasks")}
+    assert "ix_tasks_title" not in indexes
+    assert "ix_tasks_description" not in indexes
+    assert "ix_tasks_owner_id_completed_id" in indexes
+    assert "ix_tasks_pending_reminders" in indexes
+    with engine.connect() as conn:
+        assert get_version(conn) == len(MIGRATIONS)
+        assert conn.exec_driver_sql("SELECT title FROM tasks").scalar() == "Kept"
+        # pre-existing tasks enter the change feed once
+        assert conn.exec_driver_sql("SELECT change_seq FROM tasks").scalar() == 1
+
+def test_migrate_is_idempotent(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    init_db(bind=engine)
+    init_db(bind=engine)
+    with engine.connect() as conn:
+        assert get_version(conn) == len(MIGRATIONS)
@@ -0,0 +1,42 @@
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from setup_tests import client
+from app import crud, models, profiling
+from app.database import init_db
+from app.profiling import SlowQueryLog, normalize
+
+def test_normalize_collapses_literals_and_in_lists():
+    assert normalize("SELECT * FROM tasks\n WHERE id IN (?, ?, ?) AND title = 'a''b' LIMIT 10") == (
+        "SELECT * FROM tasks WHERE id IN (?...) AND title = ? LIMIT ?"
+    )
+
+def test_slow_query_log_captures_plan_and_caller(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+    init_db(bind=engine)
+    log = SlowQueryLog(threshold_ms=0, maxlen=50)
+    log.instrument(engine)
+    with Session(engine) as db:
+        crud.get_tasks(db, user_id=1)
+        db.execute(select(models.Task).where(models.Task.title == "x")).all()
+        db.execute(select(models.Task).where(models.Task.title == "y")).all()
+
+    entries = log.entries()
+    listing = next(e for e in entries if e["caller"] == "app.crud.get_tasks")
+    assert listing["full_scan"] is False
+    assert any("ix_tasks_owner_id_id" in step for step in listing["plan"])
+    assert listing["parameters"] == ["int", "int", "int"]
+
+    by_title = [e for e in entries if "WHERE tasks.title = ?" in e["statement"]]
+    assert len(by_title) == 2
+    assert by_title[0]["full_scan"] is True
+    assert by_title[0]["plan"] == by_title[1]["plan"]
+    assert len(log.entries(limit=1)) == 1
+
+def test_admin_endpoint_requires_token(monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", None)
+    assert client.get("/admin/slow-queries").status_code == 404
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    assert client.get("/admin/slow-queries", headers={"X-Admin-Token": "wrong"}).status_code == 404
+    monkeypatch.setattr(profiling, "slow_queries", SlowQueryLog(threshold_ms=5))
+    response = client.get("/admin/slow-queries", headers={"X-Admin-Token": "secret"})
+    assert response.json() == {"threshold_ms": 5, "queries": []}
@@ -1,6 +1,12 @@
-from setup_tests import client, setup_db
-from datetime import datetime
+import threading
+from setup_tests import client, setup_db, engine, TestingSessionLocal
+from datetime import datetime, timedelta, timezone
 from app.main import check_reminders  
+from app import email_utils, models
+from app.email_utils import MailQueue, SMTPConnectionPool
+from app.reminders import (
+    REMINDER_LEASE, ReminderScheduler, claim_reminders, complete_reminder, leased_elsewhere, renew_lease, scheduler
+)
 
 def test_set_reminder(setup_db):
     client.post("/users/", json={
@@ -33,3 +39,144 @@ def test_set_reminder(setup_db):
     assert response.json()["reminder_sent"] is False
 
 
+
+def test_scheduler_fires_at_reminder_time():
+    fired = []
+    done = threading.Event()
+    def fire(task_ids):
+        fired.append((task_ids, datetime.now()))
+        done.set()
+    scheduler = ReminderScheduler()
+    scheduler.start(fire)
+    try:
+        scheduler.schedule(1, datetime.now() + timedelta(seconds=5))
+        due_at = datetime.now() + timedelta(milliseconds=200)
+        scheduler.schedule(2, due_at)
+        scheduler.schedule(3, due_at)
+        scheduler.cancel(3)
+        assert done.wait(2)
+        assert fired[0][0] == [2]
+        assert fired[0][1] - due_at < timedelta(seconds=1)
+        assert len(scheduler) == 1
+    finally:
+        scheduler.stop()
+
+def test_scheduler_orders_naive_and_aware_times():
+    scheduler = ReminderScheduler()
+    scheduler.schedule(1, datetime(2030, 1, 1, 12, 0))
+    aware = datetime(2030, 1, 1, 0, 0, tzinfo=timezone(timedelta(hours=2)))
+    scheduler.schedule(2, aware)
+    assert scheduler.next_due() == min(datetime(2030, 1, 1, 12, 0), aware.astimezone().replace(tzinfo=None))
+
+def test_scheduler_thread_survives_errors():
+    fired = threading.Event()
+    scheduler = ReminderScheduler()
+    wait_for_due = scheduler._wait_for_due
+    failures = [TypeError("can't compare offset-naive and offset-aware datetimes")]
+    def flaky():
+        if failures:
+            raise failures.pop()
+        return wait_for_due()
+    scheduler._wait_for_due = flaky
+    scheduler.start(lambda task_ids: fired.set())
+    try:
+        scheduler.schedule(2, datetime.now())
+        assert fired.wait(3)
+    finally:
+        scheduler.stop()
+
+sent = []
+
+class FakeSMTP:
+    def send_message(self, message):
+        sent.append(message)
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_check_reminders_sends_due_tasks(setup_db, monkeypatch):
+    sent.clear()
+    monkeypatch.setattr(email_utils, "mail_queue", MailQueue(SMTPConnectionPool(size=1, connect=FakeSMTP), workers=0))
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    token = response.json()["access_token"]
+    task_response = client.post("/tasks/", json={
+        "title": "Due Task"
+    }, headers={"Authorization": f"Bearer {token}"})
+    task_id = task_response.json()["id"]
+    client.put(f"/tasks/{task_id}/set_reminder", json={
+        "reminder_time": "2024-09-15T12:00:00"
+    }, headers={"Authorization": f"Bearer {token}"})
+    assert scheduler.next_due() == datetime(2024, 9, 15, 12, 0)
+
+    check_reminders([task_id], bind=engine)
+    assert [message["To"] for message in sent] == ["test@example.com"]
+    response = client.get(f"/tasks/{task_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["reminder_sent"] is True
+
+    check_reminders([task_id], bind=engine)
+    assert len(sent) == 1
+
+def test_reminder_claims_are_exclusive_and_expire(setup_db):
+    db = TestingSessionLocal()
+    user = models.User(username="test_user", email="test@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    for i in range(10):
+        db.add(models.Task(
+            title=f"Task {i}",
+            owner_id=user.id,
+            completed=False,
+            reminder_time=datetime(2024, 9, 15, 12, 0),
+            reminder_sent=False
+        ))
+    db.commit()
+    db.close()
+
+    now = datetime.now()
+    with engine.begin() as conn:
+        first = claim_reminders(conn, "worker-a", now, limit=6)
+    with engine.begin() as conn:
+        second = claim_reminders(conn, "worker-b", now, limit=6)
+    with engine.begin() as conn:
+        assert claim_reminders(conn, "worker-c", now) == []
+    first_ids = {row.id for row in first}
+    second_ids = {row.id for row in second}
+    assert len(first_ids) == 6 and len(second_ids) == 4
+    assert not first_ids & second_ids
+    assert {row.email for row in first} == {"test@example.com"}
+
+    # only the lease holder can mark a reminder sent
+    task_id = next(iter(first_ids))
+    complete_reminder(engine, "worker-b", task_id)
+    with engine.connect() as conn:
+        assert len(leased_elsewhere(conn, "worker-b", now, [task_id])) == 1
+    complete_reminder(engine, "worker-a", task_id)
+
+    # worker-a goes away; its remaining leases can be taken once they expire
+    later = now + REMINDER_LEASE + timedelta(seconds=1)
+    with engine.begin() as conn:
+        reclaimed = claim_reminders(conn, "worker-c", later)
+    assert {row.id for row in reclaimed} == (first_ids | second_ids) - {task_id}
+
+    # a lease that ran out before delivery cannot be renewed, so the mail
+    # worker skips the send; the new holder can keep renewing
+    queued = next(iter(first_ids - {task_id}))
+    assert not renew_lease(engine, "worker-a", queued, later)
+    assert not renew_lease(engine, "worker-a", task_id, now)
+    assert renew_lease(engine, "worker-c", queued, later + REMINDER_LEASE / 2)
+    with engine.connect() as conn:
+        assert leased_elsewhere(conn, "worker-a", later, [queued])[0].reminder_lease_expires == later + REMINDER_LEASE * 1.5
@@ -0,0 +1,155 @@
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from app import crud, database, models, schemas, sharding
+from app.auth_cache import token_cache
+from app.database import get_db, init_db, make_engine
+from app.main import app
+from app.reminders import claim_reminders
+from app.sharding import IdAllocator, ShardMap, ShardUnavailable
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    directory = make_engine(f"sqlite:///{tmp_path / 'directory.db'}")
+    shard_engines = [make_engine(f"sqlite:///{tmp_path / f'shard{i}.db'}") for i in range(2)]
+    for target in (directory, *shard_engines):
+        init_db(bind=target)
+    monkeypatch.setattr(sharding, "SHARDED", True)
+    monkeypatch.setattr(sharding, "engine", directory)
+    # separate pools, as in production: id blocks are reserved mid-flush
+    directory_read = make_engine(f"sqlite:///{tmp_path / 'directory.db'}")
+    id_engine = make_engine(f"sqlite:///{tmp_path / 'directory.db'}")
+    monkeypatch.setattr(sharding, "read_engine", directory_read)
+    monkeypatch.setattr(sharding, "id_engine", id_engine)
+    monkeypatch.setattr(sharding, "shard_engines", shard_engines)
+    monkeypatch.setattr(sharding, "shard_read_engines", shard_engines)
+    monkeypatch.setattr(sharding, "shard_map", ShardMap(ttl=0))
+    yield directory, shard_engines
+    for target in (directory, directory_read, id_engine, *shard_engines):
+        target.dispose()
+
+def count(bind, model, **criteria):
+    with bind.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(model).filter_by(**criteria))
+
+def test_sessions_route_to_the_owners_shard_and_moves_keep_history(shards):
+    directory, shard_engines = shards
+    with sharding.session_for(None) as db:
+        user = crud.create_user(db, schemas.UserCreate(username="u", email="u@example.com", password="pw"))
+        user_id = user.id
+    source = sharding.hash_shard(user_id)
+    target = 1 - source
+
+    # distinct ids, as the shard-wide allocator would hand out
+    with sharding.session_for(user_id) as db:
+        category = crud.create_category(db, schemas.CategoryCreate(name="Work"), user_id)
+        category.id = 100
+        db.commit()
+        for i in range(3):
+            db.add(models.Task(id=200 + i, title=f"Quarterly report {i}", owner_id=user_id,
+                               category_id=100, completed=i == 0))
+        db.commit()
+        crud.delete_task(db, 202, user_id)
+        version = crud.get_user_version(db, user_id)
+        changes = crud.get_task_changes(db, user_id, 0, 100)
+    assert count(shard_engines[source], models.Task, owner_id=user_id) == 2
+    assert count(shard_engines[target], models.Task) == 0
+    assert count(directory, models.Task) == 0
+
+    sharding.move_user(user_id, target, drain=0, log=lambda message: None)
+
+    assert count(shard_engines[source], models.Task) == 0
+    assert count(shard_engines[source], models.UserVersion) == 0
+    assert count(shard_engines[source], models.TaskTombstone) == 0
+    with directory.connect() as conn:
+        assert conn.scalar(select(models.User.shard).where(models.User.id == user_id)) == target
+    with sharding.session_for(user_id, read_only=True) as db:
+        assert crud.get_user_version(db, user_id) == version
+        assert crud.get_task_changes(db, user_id, 0, 100) == changes
+        assert db.execute(crud.task_counts_statement(user_id)).one() == (2, 1)
+        assert [task.id for task in crud.get_tasks(db, user_id, search="quarterly")] == [200, 201]
+        assert crud.get_user_with_tasks(db, user_id).tasks[0].category.name == "Work"
+
+def test_placement_is_stored_and_survives_adding_a_shard(shards, tmp_path, monkeypatch):
+    directory, shard_engines = shards
+    with sharding.session_for(None) as db:
+        user_id = crud.create_user(db, schemas.UserCreate(username="u", email="u@example.com", password="pw")).id
+    with directory.connect() as conn:
+        assert conn.scalar(select(models.User.shard).where(models.User.id == user_id)) == sharding.hash_shard(user_id)
+    placed = sharding.shard_map.lookup(user_id)
+    monkeypatch.setattr(sharding, "shard_engines", [*shard_engines, make_engine(f"sqlite:///{tmp_path / 'shard2.db'}")])
+    assert sharding.shard_map.lookup(user_id) == placed
+
+def test_existing_users_stay_in_the_directory_until_spread(shards):
+    directory, shard_engines = shards
+    with directory.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"id": user_id, "username": f"u{user_id}", "email": f"u{user_id}@example.com", "hashed_password": "x"}
+            for user_id in (1, 2)
+        ])
+    for user_id in (1, 2):
+        with sharding.session_for(user_id) as db:
+            crud.create_task(db, schemas.TaskCreate(title=f"Legacy {user_id}"), user_id)
+    assert count(directory, models.Task) == 2
+
+    # an explicit source repairs a user whose entry points at the wrong place
+    with directory.begin() as conn:
+        conn.execute(models.User.__table__.update().where(models.User.id == 2).values(shard=0))
+    sharding.move_user(2, 1, drain=0, log=lambda message: None, source=None)
+    assert sharding.spread(drain=0, log=lambda message: None) == 1
+
+    assert count(directory, models.Task) == 0
+    assert count(shard_engines[1], models.Task, owner_id=2) == 1
+    assert count(shard_engines[sharding.hash_shard(1)], models.Task, owner_id=1) == 1
+    with sharding.session_for(1, read_only=True) as db:
+        assert [task.title for task in crud.get_tasks(db, 1)] == ["Legacy 1"]
+
+def test_moving_user_is_unavailable(shards):
+    directory, _ = shards
+    with sharding.session_for(None) as db:
+        user_id = crud.create_user(db, schemas.UserCreate(username="u", email="u@example.com", password="pw")).id
+    with directory.begin() as conn:
+        conn.execute(models.User.__table__.update().values(shard=-1))
+    with pytest.raises(ShardUnavailable):
+        sharding.session_for(user_id)
+    assert sharding.shard_map.lookup(user_id + 1) is None
+
+def test_id_allocators_hand_out_disjoint_blocks(shards):
+    _, shard_engines = shards
+    with shard_engines[1].begin() as conn:
+        conn.execute(models.Task.__table__.insert().values(id=41, title="Existing", owner_id=1))
+    first, second = IdAllocator("tasks", block_size=3), IdAllocator("tasks", block_size=3)
+    ids = [first(), second(), first(), first(), first(), second()]
+    assert ids == [42, 45, 43, 44, 48, 46]
+
+def test_reminder_claims_read_emails_from_the_directory(shards):
+    directory, shard_engines = shards
+    with sharding.session_for(None) as db:
+        user_id = crud.create_user(db, schemas.UserCreate(username="u", email="u@example.com", password="pw")).id
+    shard = shard_engines[sharding.hash_shard(user_id)]
+    with shard.begin() as conn:
+        conn.execute(models.Task.__table__.insert().values(
+            id=7, title="Due", owner_id=user_id, completed=False,
+            reminder_time=datetime(2024, 9, 15, 12, 0), reminder_sent=False
+        ))
+    with shard.begin() as conn, directory.connect() as users:
+        claimed = claim_reminders(conn, "worker-a", datetime.now(), directory=users)
+    assert [(row.id, row.email) for row in claimed] == [(7, "u@example.com")]
+
+def test_http_requests_route_through_get_db(shards, monkeypatch):
+    _, shard_engines = shards
+    monkeypatch.setattr(database, "SHARDED", True)
+    monkeypatch.delitem(app.dependency_overrides, get_db, raising=False)
+    token_cache.clear()
+    client = TestClient(app)
+    for i in range(3):
+        response = client.post("/users/", json={"username": f"u{i}", "email": f"u{i}@example.com", "password": "pw"})
+        assert response.status_code == 200
+        assert response.json()["tasks"] == []
+    user_id = response.json()["id"]
+    token = client.post("/token", data={"username": "u2@example.com", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/tasks/", json={"title": "Sharded"}, headers=headers).status_code == 200
+    assert [task["title"] for task in client.get("/tasks/", headers=headers).json()] == ["Sharded"]
+    assert count(shard_engines[sharding.shard_map.lookup(user_id)], models.Task, owner_id=user_id) == 1
@@ -1,4 +1,9 @@
-from setup_tests import client, setup_db
+import csv
+import io
+import json
+from app import export, fts, importer
+from app.stats import rebuild_counters
+from setup_tests import client, count_queries, engine, setup_db
 
 def test_create_task(setup_db):
     client.post("/users/", json={
@@ -90,3 +95,451 @@ def test_delete_task(setup_db):
     response = client.delete(f"/tasks/{task_id}", headers={"Authorization": f"Bearer {token}"})
     assert response.status_code == 200
     assert response.json()["id"] == task_id
+
+def test_read_tasks_cursor_pagination(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    token = response.json()["access_token"]
+    for i in range(5):
+        client.post("/tasks/", json={
+            "title": f"Task {i}",
+            "deadline": f"2024-09-1{5 - i}T13:00:00"
+        }, headers={"Authorization": f"Bearer {token}"})
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "order_by": "deadline"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/tasks/", params=params, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        seen += [task["title"] for task in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == ["Task 4", "Task 3", "Task 2", "Task 1", "Task 0"]
+
+    response = client.get("/tasks/", params={"cursor": "not-a-cursor"}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400
+
+def test_search_tasks(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    token = response.json()["access_token"]
+    client.post("/tasks/", json={
+        "title": "Groceries",
+        "description": "Buy milk and bread"
+    }, headers={"Authorization": f"Bearer {token}"})
+    client.post("/tasks/", json={
+        "title": "Buy a birthday present",
+        "description": "Something nice"
+    }, headers={"Authorization": f"Bearer {token}"})
+    task_response = client.post("/tasks/", json={
+        "title": "Call plumber"
+    }, headers={"Authorization": f"Bearer {token}"})
+    task_id = task_response.json()["id"]
+    client.put(f"/tasks/{task_id}", json={
+        "description": "Milk leak under the sink"
+    }, headers={"Authorization": f"Bearer {token}"})
+
+    response = client.get("/tasks/", params={"search": "mil"}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert {task["title"] for task in response.json()} == {"Groceries", "Call plumber"}
+
+    response = client.get("/tasks/", params={"search": "buy", "search_description": False}, headers={"Authorization": f"Bearer {token}"})
+    assert [task["title"] for task in response.json()] == ["Buy a birthday present"]
+
+    client.delete(f"/tasks/{task_id}", headers={"Authorization": f"Bearer {token}"})
+    response = client.get("/tasks/", params={"search": "leak"}, headers={"Authorization": f"Bearer {token}"})
+    assert response.json() == []
+
+def test_search_index_is_scoped_to_the_owner(setup_db):
+    users = {}
+    for name in ("alice", "bob"):
+        client.post("/users/", json={"username": name, "email": f"{name}@example.com", "password": "pw"})
+        token = client.post("/token", data={"username": f"{name}@example.com", "password": "pw"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        ids = [client.post("/tasks/", json={"title": title}, headers=headers).json()["id"] for title in ("Buy milk", "Milk run")]
+        users[name] = (headers, ids)
+    alice_headers, alice_ids = users["alice"]
+    owner_id = client.get("/users/me/", headers=alice_headers).json()["id"]
+
+    with engine.connect() as conn:
+        candidates = conn.exec_driver_sql(
+            "SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?", (fts.build_match_query("milk", owner_id),)
+        ).scalars().all()
+        # the owner id is not searchable text
+        assert conn.exec_driver_sql(
+            "SELECT count(*) FROM tasks_fts WHERE tasks_fts MATCH ?", (fts.build_match_query(str(owner_id), owner_id),)
+        ).scalar() == 0
+    assert sorted(candidates) == alice_ids
+    response = client.get("/tasks/", params={"search": "milk"}, headers=alice_headers)
+    assert [task["id"] for task in response.json()] == alice_ids
+
+def test_bulk_task_endpoints(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    token = response.json()["access_token"]
+    category_id = client.post("/categories/", json={
+        "name": "Work"
+    }, headers={"Authorization": f"Bearer {token}"}).json()["id"]
+
+    response = client.post("/tasks/bulk", json=[
+        {"title": "Task 1", "category_id": category_id},
+        {"title": "Task 2", "category_id": 999},
+        {"title": "Task 3"}
+    ], headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    created = response.json()["ids"]
+    assert len(created) == 2
+    assert response.json()["errors"] == [{"index": 1, "id": None, "detail": "Invalid category"}]
+
+    response = client.patch("/tasks/bulk", json=[
+        {"id": created[0], "completed": True},
+        {"id": created[1], "title": "Renamed", "category_id": category_id},
+        {"id": 999, "completed": True},
+        {"id": created[0], "completed": False}
+    ], headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["ids"] == created
+    assert [(error["index"], error["id"]) for error in response.json()["errors"]] == [(2, 999), (3, created[0])]
+    assert response.json()["errors"][1]["detail"] == "Duplicate id"
+    response = client.get("/tasks/", headers={"Authorization": f"Bearer {token}"})
+    assert [(task["title"], task["completed"]) for task in response.json()] == [("Task 1", True), ("Renamed", False)]
+
+    response = client.request("DELETE", "/tasks/bulk", json={
+        "ids": [created[0], 999, created[0]]
+    }, headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["ids"] == [created[0]]
+    assert [(error["index"], error["detail"]) for error in response.json()["errors"]] == [
+        (1, "Task not found or not authorized"), (2, "Duplicate id")
+    ]
+    response = client.get("/tasks/", headers={"Authorization": f"Bearer {token}"})
+    assert [task["id"] for task in response.json()] == [created[1]]
+
+def test_task_relationships_load_without_n_plus_one(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for i in range(5):
+        category = client.post("/categories/", json={"name": f"Category {i}"}, headers=headers).json()
+        client.post("/tasks/", json={"title": f"Task {i}", "category_id": category["id"]}, headers=headers)
+
+    with count_queries() as statements:
+        response = client.get("/tasks/", headers=headers)
+    assert len(response.json()) == 5
+    assert all(task["category"]["name"].startswith("Category") for task in response.json())
+    # the ETag version lookup plus one query for tasks and categories
+    assert len(statements) == 2
+
+    with count_queries() as statements:
+        response = client.get("/tasks/?include=", headers=headers)
+    assert all(task["category"] is None for task in response.json())
+    assert len(statements) == 2
+
+    with count_queries() as statements:
+        response = client.get("/users/me/?version=1", headers=headers)
+    assert len(response.json()["tasks"]) == 5
+    assert len(statements) == 2
+
+    assert client.get("/tasks/?include=owner", headers=headers).status_code == 400
+
+def test_sparse_fields_match_full_response(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    category = client.post("/categories/", json={"name": "Work"}, headers=headers).json()
+    client.post("/tasks/", json={
+        "title": "Task 1",
+        "deadline": "2024-09-15T13:00:00.250000",
+        "category_id": category["id"]
+    }, headers=headers)
+    client.post("/tasks/", json={"title": "Task 2", "completed": True}, headers=headers)
+    client.post("/tasks/", json={"title": "Task 3"}, headers=headers)
+
+    full = client.get("/tasks/", params={"limit": 2}, headers=headers)
+    all_fields = ",".join(full.json()[0])
+    projected = client.get("/tasks/", params={"limit": 2, "fields": all_fields}, headers=headers)
+    assert projected.json() == full.json()
+    assert projected.headers["X-Next-Cursor"] == full.headers["X-Next-Cursor"]
+
+    response = client.get("/tasks/", params={
+        "fields": "title",
+        "cursor": projected.headers["X-Next-Cursor"]
+    }, headers=headers)
+    assert response.json() == [{"title": "Task 3"}]
+
+    response = client.get("/tasks/", params={"fields": "title,category", "completed": False}, headers=headers)
+    assert response.json() == [
+        {"title": "Task 1", "category": {"name": "Work", "id": category["id"], "owner_id": category["owner_id"]}},
+        {"title": "Task 3", "category": None}
+    ]
+    assert client.get("/tasks/", params={"fields": "title,password"}, headers=headers).status_code == 400
+
+    # the cursor must carry the task id, not the joined category's
+    titles, cursor = [], None
+    for _ in range(4):
+        params = {"fields": "title,category", "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/tasks/", params=params, headers=headers)
+        titles += [task["title"] for task in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert titles == ["Task 1", "Task 2", "Task 3"]
+
+def test_accept_encoding_honours_q_values():
+    assert export.accepts_gzip("gzip, deflate, br")
+    assert export.accepts_gzip("deflate;q=1.0, GZIP;q=0.5")
+    assert export.accepts_gzip("*")
+    assert not export.accepts_gzip("gzip;q=0")
+    assert not export.accepts_gzip("gzip; q=0.000, *")
+    assert not export.accepts_gzip("*;q=0")
+    assert not export.accepts_gzip("identity")
+    assert not export.accepts_gzip("")
+
+def test_export_tasks(setup_db, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    category = client.post("/categories/", json={"name": "Work"}, headers=headers).json()
+    client.post("/tasks/", json={"title": "Task 0", "category_id": category["id"], "deadline": "2024-09-15T13:00:00"}, headers=headers)
+    for i in range(1, 5):
+        client.post("/tasks/", json={"title": f"Task {i}"}, headers=headers)
+
+    response = client.get("/tasks/export", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == client.get("/tasks/", params={"limit": 100}, headers=headers).json()
+
+    response = client.get("/tasks/export", params={"format": "csv"}, headers={**headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    refused = client.get("/tasks/export", headers={**headers, "Accept-Encoding": "gzip;q=0, identity"})
+    assert "content-encoding" not in refused.headers
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["title"] for row in rows] == [f"Task {i}" for i in range(5)]
+    assert rows[0]["category_name"] == "Work"
+    assert rows[0]["deadline"] == "2024-09-15T13:00:00"
+    assert rows[1]["category_name"] == ""
+
+def test_import_tasks(setup_db, monkeypatch):
+    monkeypatch.setattr(importer, "IMPORT_CHUNK_SIZE", 2)
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    client.post("/categories/", json={"name": "Work"}, headers=headers)
+
+    ndjson = "\n".join([
+        json.dumps({"title": "Task 1", "category": {"name": "Work"}}),
+        json.dumps({"title": "Task 2", "completed": True, "deadline": "2024-09-15T13:00:00"}),
+        "{not json",
+        json.dumps({"description": "no title"}),
+        json.dumps({"title": "Task 3", "category_id": 9999}),
+        json.dumps({"title": "Task 4", "category_name": "Home"}),
+    ])
+    response = client.post("/tasks/import", files={"file": ("tasks.ndjson", ndjson)}, headers=headers)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["imported"] == 3
+    assert result["failed"] == 3
+    assert [error["line"] for error in result["errors"]] == [3, 4, 5]
+    assert "title" in result["errors"][1]["detail"]
+
+    tasks = client.get("/tasks/", params={"limit": 100}, headers=headers).json()
+    assert [(task["title"], task["category"] and task["category"]["name"]) for task in tasks] == [
+        ("Task 1", "Work"), ("Task 2", None), ("Task 4", "Home")
+    ]
+    assert tasks[1]["completed"] is True
+
+    exported = client.get("/tasks/export", params={"format": "csv"}, headers=headers).text
+    response = client.post("/tasks/import", files={"file": ("tasks.csv", exported)}, headers=headers)
+    assert response.json() == {"imported": 3, "failed": 0, "errors": []}
+    categories = client.get("/categories/", headers=headers).json()
+    assert sorted(category["name"] for category in categories) == ["Home", "Work"]
+
+def test_conditional_get_on_collections(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    task_id = client.post("/tasks/", json={"title": "Task 1"}, headers=headers).json()["id"]
+
+    response = client.get("/tasks/", headers=headers)
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+    with count_queries() as statements:
+        response = client.get("/tasks/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert len(statements) == 1
+    assert "tasks" not in statements[0].split("FROM")[1]
+
+    assert client.get("/tasks/", params={"completed": False}, headers=headers).headers["ETag"] != etag
+    projected = client.get("/tasks/", params={"fields": "title"}, headers=headers)
+    assert client.get("/tasks/", params={"fields": "title"}, headers={
+        **headers, "If-None-Match": projected.headers["ETag"]
+    }).status_code == 304
+
+    categories_etag = client.get("/categories/", headers=headers).headers["ETag"]
+    client.post("/categories/", json={"name": "Work"}, headers=headers)
+    response = client.get("/categories/", headers={**headers, "If-None-Match": categories_etag})
+    assert response.status_code == 200
+    assert [category["name"] for category in response.json()] == ["Work"]
+
+    client.put(f"/tasks/{task_id}", json={"completed": True}, headers=headers)
+    response = client.get("/tasks/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]["completed"] is True
+    assert response.headers["ETag"] != etag
+
+def test_task_changes_feed(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    ids = [client.post("/tasks/", json={"title": f"Task {i}"}, headers=headers).json()["id"] for i in range(3)]
+
+    response = client.get("/tasks/changes", params={"limit": 2}, headers=headers).json()
+    assert [task["id"] for task in response["changes"]] == ids[:2]
+    assert response["has_more"] is True
+    response = client.get("/tasks/changes", params={"since": response["next_since"]}, headers=headers).json()
+    assert [task["id"] for task in response["changes"]] == ids[2:]
+    assert response["has_more"] is False
+    since = response["next_since"]
+
+    assert client.get("/tasks/changes", params={"since": since}, headers=headers).json() == {
+        "changes": [], "deleted": [], "next_since": since, "has_more": False
+    }
+
+    client.put(f"/tasks/{ids[0]}", json={"completed": True}, headers=headers)
+    client.delete(f"/tasks/{ids[1]}", headers=headers)
+    client.put(f"/tasks/{ids[0]}", json={"title": "Renamed"}, headers=headers)
+    response = client.get("/tasks/changes", params={"since": since}, headers=headers).json()
+    assert [(task["id"], task["title"], task["completed"]) for task in response["changes"]] == [(ids[0], "Renamed", True)]
+    assert response["deleted"] == [ids[1]]
+    assert response["next_since"] > since
+
+def test_reused_task_id_keeps_tombstone(setup_db):
+    headers = []
+    for name in ("alice", "bob"):
+        client.post("/users/", json={"username": name, "email": f"{name}@example.com", "password": "pw"})
+        token = client.post("/token", data={"username": f"{name}@example.com", "password": "pw"}).json()["access_token"]
+        headers.append({"Authorization": f"Bearer {token}"})
+    alice, bob = headers
+    task_id = client.post("/tasks/", json={"title": "Mine"}, headers=alice).json()["id"]
+    client.delete(f"/tasks/{task_id}", headers=alice)
+    # SQLite hands the freed max id to the next insert
+    assert client.post("/tasks/", json={"title": "Theirs"}, headers=bob).json()["id"] == task_id
+
+    response = client.get("/tasks/changes", headers=alice).json()
+    assert response["changes"] == []
+    assert response["deleted"] == [task_id]
+
+def test_task_stats(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    work = client.post("/categories/", json={"name": "Work"}, headers=headers).json()["id"]
+    home = client.post("/categories/", json={"name": "Home"}, headers=headers).json()["id"]
+    ids = [client.post("/tasks/", json=body, headers=headers).json()["id"] for body in [
+        {"title": "Overdue", "category_id": work, "deadline": "2000-01-01T00:00:00"},
+        {"title": "Done", "category_id": work, "completed": True, "deadline": "2000-01-01T00:00:00"},
+        {"title": "Future", "category_id": home, "deadline": "2999-01-01T00:00:00"},
+        {"title": "Loose"},
+    ]]
+    client.post("/tasks/bulk", json=[{"title": "Bulk", "category_id": home}], headers=headers)
+
+    def stats():
+        response = client.get("/tasks/stats", headers=headers).json()
+        return response, {c["name"]: (c["total"], c["completed"]) for c in response["categories"]}
+
+    response, by_name = stats()
+    assert (response["total"], response["completed"], response["pending"], response["overdue"]) == (5, 1, 4, 1)
+    assert by_name == {None: (1, 0), "Work": (2, 1), "Home": (2, 0)}
+
+    client.put(f"/tasks/{ids[0]}", json={"completed": True, "category_id": home}, headers=headers)
+    client.delete(f"/tasks/{ids[3]}", headers=headers)
+    response, by_name = stats()
+    assert (response["total"], response["completed"], response["overdue"]) == (4, 2, 0)
+    assert by_name == {"Work": (1, 1), "Home": (3, 1)}
+
+    client.delete(f"/categories/{home}", headers=headers)
+    response, by_name = stats()
+    assert by_name == {None: (3, 1), "Work": (1, 1)}
+    assert client.get(f"/tasks/{ids[2]}", headers=headers).json()["category_id"] is None
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE task_counters SET total = 99")
+        rebuild_counters(conn)
+    assert stats() == (response, by_name)
+    assert client.get("/users/me/", headers=headers).json()["task_counts"]["total"] == 4
@@ -1,4 +1,13 @@
-from setup_tests import client, setup_db
+import threading
+import time
+import pytest
+from passlib.context import CryptContext
+from sqlalchemy.orm import sessionmaker
+from setup_tests import client, setup_db, TestingSessionLocal
+from app import crud, models, security
+from app.database import get_db, init_db, make_engine
+from app.main import app
+from app.auth_cache import TokenCache, UserSnapshot, token_cache
 
 def test_create_user(setup_db):
     response = client.post("/users/", json={
@@ -39,3 +48,143 @@ def test_read_users_me(setup_db):
     assert response.status_code == 200
     assert response.json()["username"] == "test_user"
     assert response.json()["email"] == "test@example.com"
+
+def test_token_cache_serves_repeat_requests(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    token = response.json()["access_token"]
+    client.get("/tasks/", headers={"Authorization": f"Bearer {token}"})
+    assert token_cache.get(token)[1].email == "test@example.com"
+
+    db = TestingSessionLocal()
+    user = db.query(models.User).filter(models.User.email == "test@example.com").first()
+    user.username = "renamed_user"
+    db.flush()
+    # a request before the commit still sees, and may re-cache, the old row
+    client.get("/tasks/", headers={"Authorization": f"Bearer {token}"})
+    assert token_cache.get(token)[1].username == "test_user"
+    db.commit()
+    db.close()
+    assert token_cache.get(token) is None
+
+    response = client.get("/users/me/", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["username"] == "renamed_user"
+
+def test_token_cache_is_bounded_and_honours_exp():
+    cache = TokenCache(maxsize=2, ttl=60)
+    user = UserSnapshot(id=1, username="u", email="u@example.com", is_active=True)
+    cache.put("a", {"exp": time.time() + 600}, user)
+    cache.put("b", {"exp": time.time() + 600}, user)
+    cache.put("c", {"exp": time.time() + 600}, user)
+    assert cache.get("a") is None
+    assert len(cache) == 2
+    cache.put("expired", {"exp": time.time() - 1}, user)
+    assert cache.get("expired") is None
+    cache.invalidate_user(1)
+    assert len(cache) == 0
+
+def test_login_rehashes_outdated_password(setup_db):
+    legacy_context = CryptContext(schemes=['bcrypt'], bcrypt__rounds=4)
+    db = TestingSessionLocal()
+    db.add(models.User(
+        username="legacy_user",
+        email="legacy@example.com",
+        hashed_password=legacy_context.hash("test_password")
+    ))
+    db.commit()
+    db.close()
+    response = client.post("/token", data={
+        "username": "legacy@example.com",
+        "password": "test_password"
+    })
+    assert response.status_code == 200
+    db = TestingSessionLocal()
+    user = db.query(models.User).filter(models.User.email == "legacy@example.com").first()
+    assert not security.pwd_context.needs_update(user.hashed_password)
+    db.close()
+
+def test_password_hasher_sheds_when_saturated():
+    hasher = security.PasswordHasher(workers=0, concurrency=1)
+    worker = threading.Thread(target=hasher._run, args=(time.sleep, 0.3))
+    worker.start()
+    time.sleep(0.05)
+    start = time.perf_counter()
+    with pytest.raises(security.PasswordHasherBusy):
+        hasher.hash("test_password")
+    # shed without waiting for the slot to free up
+    assert time.perf_counter() - start < 0.1
+    worker.join()
+    assert hasher.stats()["rejected"] == 1
+    assert hasher.stats()["completed"] == 1
+
+def test_read_users_me_profile(setup_db):
+    client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    })
+    response = client.post("/token", data={
+        "username": "test@example.com",
+        "password": "test_password"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for i in range(3):
+        client.post("/tasks/", json={"title": f"Task {i}", "completed": i == 0}, headers=headers)
+
+    response = client.get("/users/me/", headers=headers)
+    assert response.json()["task_counts"] == {"total": 3, "completed": 1, "pending": 2}
+    assert response.json()["tasks_url"] == "/tasks/"
+    assert response.json()["tasks"] is None
+
+    response = client.get("/users/me/", params={"include_tasks": 2}, headers=headers)
+    assert [task["title"] for task in response.json()["tasks"]] == ["Task 0", "Task 1"]
+
+    response = client.get("/users/me/", params={"version": "1"}, headers=headers)
+    assert "task_counts" not in response.json()
+    assert len(response.json()["tasks"]) == 3
+
+    assert client.get("/users/me/", params={"include_tasks": 1000}, headers=headers).status_code == 422
+
+def test_hashing_does_not_hold_the_writer_connection(tmp_path, monkeypatch):
+    # a single-connection writer pool, as in production
+    engine = make_engine(f"sqlite:///{tmp_path / 'writer.db'}")
+    init_db(bind=engine)
+    WriterSession = sessionmaker(autoflush=False, bind=engine)
+    def override_get_db():
+        with WriterSession() as db:
+            yield db
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+
+    writes = []
+    def write_while_hashing(fn):
+        def wrapper(*args):
+            assert engine.pool.checkedout() == 0
+            with engine.begin() as conn:
+                conn.exec_driver_sql("UPDATE users SET is_active = 1")
+            writes.append(fn.__name__)
+            return fn(*args)
+        return wrapper
+    legacy_context = CryptContext(schemes=['bcrypt'], bcrypt__rounds=4)
+    monkeypatch.setattr(crud, "hash_password", write_while_hashing(legacy_context.hash))
+    monkeypatch.setattr(security, "verify_and_update", write_while_hashing(security.verify_and_update))
+
+    token_cache.clear()
+    assert client.post("/users/", json={
+        "username": "test_user",
+        "email": "test@example.com",
+        "password": "test_password"
+    }).status_code == 200
+    response = client.post("/token", data={"username": "test@example.com", "password": "test_password"})
+    assert response.status_code == 200
+    assert writes == ["hash", "verify_and_update"]
+    # the outdated hash was still saved after verification
+    with WriterSession() as db:
+        assert not security.pwd_context.needs_update(db.query(models.User).one().hashed_password)
+    engine.dispose()